@@ -1,21 +1,40 @@
 import discord
-from discord.ext import commands, tasks
-import yt_dlp
+from discord.ext import commands
 import asyncio
+import contextlib
+import difflib
 import time
 import json
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth  # Verwende jetzt OAuth
-from collections import deque
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import heapq
+import itertools
 import logging
+import math
+import multiprocessing
 import os
+import re
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import traceback
+
+import ytdl_jobs
+from ytdl_jobs import YDL_PROFILES, STREAM_INFO_KEYS, extract_info_job, load_yt_dlp
+
+MODULE_STARTED = time.perf_counter()   # für die Zeitmessung von --check
 
 ##############################################
 # 1. Logging, Konfiguration & Sprachdateien
 ##############################################
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CONFIG_PATH = os.path.join(BASE_DIR, "config", "config.json")
+# T_MUSICBOT_CONFIG erlaubt eine alternative config.json (z. B. für benchmark.py)
+CONFIG_PATH = os.environ.get("T_MUSICBOT_CONFIG", os.path.join(BASE_DIR, "config", "config.json"))
 LANG_PATH = os.path.join(BASE_DIR, "config", "lang.json")
+DATA_DIR = os.path.join(BASE_DIR, "data")
 ERROR_LOG_PATH = os.path.join(BASE_DIR, "error.log")
 
 if not os.path.exists(ERROR_LOG_PATH):
@@ -38,17 +57,20 @@ def load_config():
         raise
 
 
-def load_language(language_code):
+def load_languages():
     try:
         with open(LANG_PATH, 'r', encoding='utf-8') as f:
-            languages = json.load(f)
-            default_language = languages.get('en') or next(iter(languages.values()))
-            return languages.get(language_code, default_language)
+            return json.load(f)
     except Exception as e:
         logging.error(f"Error loading lang.json: {e}")
         raise
 
 
+def load_language(language_code):
+    default_language = languages.get('en') or next(iter(languages.values()))
+    return languages.get(language_code, default_language)
+
+
 def normalize_spotify_url(url: str) -> str:
     """
     Entfernt unerwünschte Segmente wie "/intl-de" aus dem Spotify-Link.
@@ -56,22 +78,150 @@ def normalize_spotify_url(url: str) -> str:
     return url.replace("/intl-de", "")
 
 
+def extract_spotify_id(url: str, kind: str):
+    """
+    Liefert die ID aus einem Spotify-Link, z. B. kind="track" für open.spotify.com/track/<id>.
+    """
+    try:
+        return normalize_spotify_url(url).split(f"{kind}/")[1].split("?")[0]
+    except IndexError:
+        return None
+
+
+def create_spotify_client(settings):
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth  # Verwende jetzt OAuth
+    return spotipy.Spotify(auth_manager=SpotifyOAuth(
+        client_id=settings['spotify_client_id'],
+        client_secret=settings['spotify_client_secret'],
+        redirect_uri="http://localhost:8888/callback",
+        scope="playlist-read-private user-library-read user-follow-read"
+    ))
+
+
+def run_check():
+    """
+    Prüft config.json, lang.json und die Abhängigkeiten, ohne sich mit Discord zu verbinden, und
+    misst die Dauer jedes Schritts. Läuft vor allem, was von config.json abhängt, damit auch eine
+    kaputte Konfiguration gemeldet statt mit einem Traceback quittiert wird.
+    Gibt den Exit-Code zurück (0 = alles in Ordnung).
+    """
+    settings = {}
+    texts = {}
+
+    def check_config():
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            settings.update(json.load(f))
+        # Diese Einträge liest der Bot ohne Standardwert
+        missing = [key for key in ('bot_token', 'language', 'command_prefix', 'ffmpeg_path') if not settings.get(key)]
+        if not (settings.get('embed_settings') or {}).get('footer'):
+            missing.append('embed_settings.footer')
+        if missing:
+            raise ValueError(f"fehlende Einträge: {', '.join(missing)}")
+        if settings['bot_token'].startswith("DEIN_"):
+            raise ValueError("bot_token ist noch der Platzhalter")
+        if settings.get('playback_mode', 'opus') not in ('opus', 'pcm'):
+            raise ValueError(f"unbekannter playback_mode '{settings['playback_mode']}'")
+        broken = [key for key, command in (settings.get('commands') or {}).items()
+                  if not isinstance(command, dict) or not isinstance(command.get('name', key), str)]
+        if broken:
+            raise ValueError(f"ungültige Befehle: {', '.join(broken)}")
+
+    def check_languages():
+        with open(LANG_PATH, 'r', encoding='utf-8') as f:
+            texts.update(json.load(f))
+        # Maßgeblich sind die Texte, die der Code tatsächlich verwendet
+        with open(os.path.abspath(__file__), 'r', encoding='utf-8') as f:
+            used = set(re.findall(r"lang\['(\w+)'\]", f.read()))
+        if settings.get('language') and settings['language'] not in texts:
+            raise ValueError(f"Sprache '{settings['language']}' fehlt in lang.json")
+        incomplete = {code: sorted(used - set(language)) for code, language in texts.items() if used - set(language)}
+        if incomplete:
+            raise ValueError("fehlende Texte: " + "; ".join(
+                f"{code}: {', '.join(keys)}" for code, keys in incomplete.items()
+            ))
+        return f"{len(texts)} Sprachen, {len(used)} Texte"
+
+    def check_ffmpeg():
+        ffmpeg = settings.get('ffmpeg_path') or 'ffmpeg'
+        path = shutil.which(ffmpeg)
+        if path is None:
+            raise ValueError(f"'{ffmpeg}' nicht gefunden")
+        return path
+
+    def check_data_dir():
+        os.makedirs(DATA_DIR, exist_ok=True)
+        if not os.access(DATA_DIR, os.W_OK):
+            raise ValueError(f"{DATA_DIR} ist nicht beschreibbar")
+
+    def check_yt_dlp():
+        import yt_dlp
+        return f"Version {yt_dlp.version.__version__}"
+
+    def check_spotify():
+        client_id = settings.get('spotify_client_id') or ""
+        if not client_id or client_id.startswith("DEIN_"):
+            # Spotify ist optional – ohne Zugangsdaten funktionieren nur Spotify-Links nicht
+            return "nicht konfiguriert, Spotify-Links deaktiviert"
+        create_spotify_client(settings)
+
+    print(f"{'Modul geladen':<16} {(time.perf_counter() - MODULE_STARTED) * 1000:8.1f} ms")
+    failed = False
+    for name, check in (
+        ("config.json", check_config), ("lang.json", check_languages), ("FFmpeg", check_ffmpeg),
+        ("Datenordner", check_data_dir), ("yt-dlp", check_yt_dlp), ("Spotify", check_spotify)
+    ):
+        started = time.perf_counter()
+        try:
+            result = check() or "OK"
+        except Exception as e:
+            result = f"FEHLER: {e}"
+            failed = True
+        print(f"{name:<16} {(time.perf_counter() - started) * 1000:8.1f} ms  {result}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__" and "--check" in sys.argv[1:]:
+    sys.exit(run_check())
+
 config = load_config()
+languages = load_languages()     # Alle Sprachen einmalig laden – Server können eigene Sprachen wählen
 lang = load_language(config['language'])
 
 ##############################################
-# 2. Spotify-Authentifizierung (OAuth)
+# 2. Spotify-Authentifizierung (OAuth) & verzögerte Importe
 ##############################################
-try:
-    sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-        client_id=config['spotify_client_id'],
-        client_secret=config['spotify_client_secret'],
-        redirect_uri="http://localhost:8888/callback",
-        scope="playlist-read-private user-library-read user-follow-read"
-    ))
-except Exception as e:
-    logging.error(f"Error during Spotify authentication: {e}")
-    raise
+# yt-dlp und spotipy werden erst bei der ersten Verwendung geladen (bzw. nach on_ready im
+# Hintergrund vorgewärmt) – ihr Import dauert länger als der restliche Start des Bots.
+sp = None                        # Spotify-Client, angelegt von get_spotify()
+_spotify_lock = threading.Lock()
+
+
+def get_spotify():
+    """
+    Legt den Spotify-Client beim ersten Zugriff an. Fehlerhafte Zugangsdaten betreffen so nur
+    Spotify-Links, nicht den Start des Bots.
+    """
+    global sp
+    with _spotify_lock:
+        if sp is None:
+            try:
+                sp = create_spotify_client(config)
+            except Exception as e:
+                logging.error(f"Error during Spotify authentication: {e}")
+                raise
+        return sp
+
+
+def warm_up():
+    """Lädt yt-dlp und den Spotify-Client vor, damit der erste !play nicht darauf wartet."""
+    started = time.perf_counter()
+    load_yt_dlp()
+    try:
+        get_spotify()
+    except Exception:
+        pass
+    print(f"DEBUG: yt-dlp und Spotify-Client in {time.perf_counter() - started:.2f}s geladen")
 
 ##############################################
 # 3. Discord Bot Setup & Hilfsfunktionen
@@ -80,7 +230,6 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 intents.voice_states = True
-intents.reactions = True
 
 
 def get_command_info(command_key):
@@ -90,11 +239,32 @@ def get_command_info(command_key):
     return name, aliases
 
 
-bot = commands.Bot(
-    command_prefix=config['command_prefix'],
-    intents=intents,
-    help_command=None
-)
+# Sharding: Entweder verteilt ein AutoShardedBot alle Shards in diesem Prozess, oder der
+# Koordinator (siehe Abschnitt 9) startet mehrere Worker und gibt jedem seine Shard-IDs per
+# Umgebungsvariable mit. Alle Worker teilen sich config.json und die SQLite-Dateien in data/.
+sharding = config.get('sharding', {})
+worker_shard_ids = os.environ.get("T_MUSICBOT_SHARD_IDS")
+worker_index = int(os.environ.get("T_MUSICBOT_WORKER", 0))
+
+if worker_shard_ids or sharding.get('enabled', False):
+    shard_options = {}
+    if worker_shard_ids:
+        shard_options['shard_ids'] = [int(shard_id) for shard_id in worker_shard_ids.split(",")]
+        shard_options['shard_count'] = int(os.environ["T_MUSICBOT_SHARD_COUNT"])
+    elif sharding.get('shard_count'):
+        shard_options['shard_count'] = sharding['shard_count']
+    bot = commands.AutoShardedBot(
+        command_prefix=config['command_prefix'],
+        intents=intents,
+        help_command=None,
+        **shard_options
+    )
+else:
+    bot = commands.Bot(
+        command_prefix=config['command_prefix'],
+        intents=intents,
+        help_command=None
+    )
 
 
 def voice_text_channel_only():
@@ -116,40 +286,861 @@ def voice_text_channel_only():
 bot.add_check(voice_text_channel_only())
 
 ##############################################
-# 4. Globale Variablen & Funktionen
+# 3a. Metriken (Prometheus-Textformat, optional)
 ##############################################
-volume = config.get('default_volume', 50)
-song_queue = deque()         # Speichert Tupel: (ctx, youtube_url)
-played_songs = deque()
-current_song = None
-current_title = None
-current_thumbnail = None
-now_playing_message = None
-is_looping = False
-progress_start_time = 0
-progress_duration = 0
-progress_last_progress = -1
-url_cache = {}
-
-
-def save_volume(vol):
-    global config
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self.values.items():
+                lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}                 # labels -> [Zähler pro Bucket, Summe, Anzahl]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in self.series.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels(labels + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {total:.6f}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+def render_samples(name, description, samples, kind="gauge"):
+    """Für Werte, die erst beim Abruf aus dem Bot-Zustand gelesen werden."""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {value}")
+    return lines
+
+
+extract_latency = Histogram("t_musicbot_extract_info_seconds", "Dauer von yt-dlp extract_info je Profil")
+spotify_latency = Histogram("t_musicbot_spotify_request_seconds", "Dauer von Spotify-API-Aufrufen je Methode")
+discord_requests = Counter("t_musicbot_discord_requests_total", "Discord-REST-Aufrufe je Route und Status")
+
+
+def collect_metrics():
+    """Erzeugt die komplette Ausgabe für /metrics; Gauges werden beim Abruf berechnet."""
+    lines = extract_latency.render() + spotify_latency.render() + loop_lag.render()
+    lines += render_samples(
+        "t_musicbot_cache_requests_total", "Cache-Abfragen je Cache und Ergebnis",
+        [({'cache': 'search', 'result': 'hit'}, search_cache.hits),
+         ({'cache': 'search', 'result': 'negative_hit'}, search_cache.negative_hits),
+         ({'cache': 'search', 'result': 'miss'}, search_cache.misses),
+         ({'cache': 'stream_url', 'result': 'hit'}, stream_cache.hits),
+         ({'cache': 'stream_url', 'result': 'miss'}, stream_cache.misses),
+         ({'cache': 'spotify_playlist', 'result': 'hit'}, playlist_cache.hits),
+         ({'cache': 'spotify_playlist', 'result': 'miss'}, playlist_cache.misses),
+         ({'cache': 'audio', 'result': 'hit'}, audio_cache.hits),
+         ({'cache': 'audio', 'result': 'miss'}, audio_cache.misses)],
+        kind="counter"
+    )
+    pending = extraction_pool.pending()
+    lines += render_samples(
+        "t_musicbot_extraction_jobs", "Aufträge im Extraktions-Pool je Klasse und Zustand",
+        [({'class': priority, 'state': 'running'}, count) for priority, count in extraction_pool.running.items()]
+        + [({'class': priority, 'state': 'pending'}, count) for priority, count in pending.items()]
+    )
+    lines += render_samples(
+        "t_musicbot_queue_length", "Einträge in der Warteschlange je Server",
+        [({'guild': guild_id}, len(player.song_queue)) for guild_id, player in list(players.items())]
+    )
+    voice_clients = list(bot.voice_clients)
+    playing = sum(
+        1 for voice_client in voice_clients
+        if isinstance(getattr(voice_client.source, 'original', voice_client.source), discord.FFmpegAudio)
+    )
+    lines += render_samples("t_musicbot_voice_clients", "Verbundene Voice-Clients", [({}, len(voice_clients))])
+    lines += render_samples(
+        "t_musicbot_ffmpeg_processes", "Laufende FFmpeg-Prozesse",
+        [({'kind': 'playback'}, playing), ({'kind': 'audio_cache'}, len(audio_cache._filling))]
+    )
+    lines += discord_requests.render()
+    return "\n".join(lines) + "\n"
+
+
+def instrument_discord_http():
+    """Zählt alle REST-Aufrufe von discord.py nach Methode, Routen-Vorlage und Status."""
+    original_request = bot.http.request
+
+    async def request(route, **kwargs):
+        status = "ok"
+        try:
+            return await original_request(route, **kwargs)
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            discord_requests.inc(method=route.method, route=route.path, status=status)
+
+    bot.http.request = request
+
+
+async def handle_metrics_request(reader, writer):
     try:
-        config['default_volume'] = vol
-        with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Header bis zur Leerzeile verwerfen
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = collect_metrics().encode('utf-8')
+            head = "HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+        else:
+            body = b"Not Found\n"
+            head = "HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\n"
+        writer.write(f"{head}Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
     except Exception as e:
-        logging.error(f"Error saving config.json: {e}")
+        logging.error(f"Error serving metrics: {e}")
+    finally:
+        writer.close()
 
 
 ##############################################
-# 4a. Spotify-Hilfsfunktionen
+# 3b. Event-Loop-Watchdog & Profiling
+##############################################
+loop_lag = Histogram("t_musicbot_event_loop_lag_seconds", "Verspätung des Event-Loop-Heartbeats",
+                     buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+
+class LoopWatchdog:
+    """
+    Ein Heartbeat-Task misst die Verspätung des Event-Loops. Ein separater Thread prüft, ob der
+    Heartbeat länger als `threshold` Sekunden ausbleibt, und protokolliert dann den Stack dessen,
+    was den Loop gerade blockiert – noch während es läuft.
+    """
+
+    def __init__(self, threshold=0.25, interval=0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop_thread_id = None
+        self.last_beat = time.monotonic()
+        self.reported = False
+        self.stalls = 0
+        self.max_lag = 0.0
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            loop_lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                logging.error(f"Event loop was blocked for {lag * 1000:.0f} ms")
+            self.last_beat = now
+            self.reported = False
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            stalled = time.monotonic() - self.last_beat - self.interval
+            if stalled <= self.threshold or self.reported:
+                continue
+            self.reported = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unknown>\n"
+            logging.error(f"Event loop blocked for more than {stalled * 1000:.0f} ms, current stack:\n{stack}")
+
+
+watchdog_settings = config.get('watchdog', {})
+loop_watchdog = LoopWatchdog(
+    threshold=watchdog_settings.get('threshold_ms', 250) / 1000,
+    interval=watchdog_settings.get('interval_ms', 100) / 1000
+)
+
+# Wartende Threads (Selector, Locks, Queues) sagen nichts über Rechenzeit aus. Der Audio-Thread
+# von discord.py steht zwischen zwei Paketen in time.sleep direkt in AudioPlayer._do_run.
+PROFILE_IDLE_MODULES = ('selectors.py', 'threading.py', 'queue.py', 'socket.py', 'ssl.py', 'subprocess.py')
+PROFILE_IDLE_FUNCTIONS = ('_do_run',)
+
+
+def sample_profile(seconds, interval=0.005, top=15):
+    """
+    Sampling-Profiler über alle Threads des Bots. Gibt (samples, [(self %, inkl. %, Ort)])
+    zurück, sortiert nach der Zeit, in der die Funktion selbst oben auf dem Stack lag.
+    """
+    ignored_threads = {threading.get_ident()}
+    ignored_threads.update(thread.ident for thread in threading.enumerate() if thread.name == "loop-watchdog")
+    self_counts = {}
+    inclusive_counts = {}
+    samples = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in ignored_threads:
+                continue
+            if (os.path.basename(frame.f_code.co_filename) in PROFILE_IDLE_MODULES
+                    or frame.f_code.co_name in PROFILE_IDLE_FUNCTIONS):
+                continue
+            samples += 1
+            seen = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                key = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno} {code.co_name}"
+                if leaf:
+                    self_counts[key] = self_counts.get(key, 0) + 1
+                    leaf = False
+                if key not in seen:
+                    seen.add(key)
+                    inclusive_counts[key] = inclusive_counts.get(key, 0) + 1
+                frame = frame.f_back
+        time.sleep(interval)
+    hottest = sorted(self_counts.items(), key=lambda item: item[1], reverse=True)[:top]
+    return samples, [
+        (100 * count / samples, 100 * inclusive_counts[key] / samples, key)
+        for key, count in hottest
+    ]
+
+
+async def start_metrics_server():
+    settings = config.get('metrics', {})
+    if not settings.get('enabled', False):
+        return None
+    instrument_discord_http()
+    host = settings.get('host', '127.0.0.1')
+    # Jeder Worker-Prozess bekommt einen eigenen Port (port, port + 1, ...)
+    port = settings.get('port', 9108) + worker_index
+    server = await asyncio.start_server(handle_metrics_request, host, port)
+    print(f"DEBUG: Metriken unter http://{host}:{port}/metrics")
+    return server
+
+##############################################
+# 4. Globale Variablen & Funktionen
+##############################################
+# Anzahl der Queue-Einträge vor dem aktuellen Song, die vorab aufgelöst werden
+lookahead = max(1, int(config.get('lookahead', 3)))
+PREFETCH_MAX_AGE = 3600      # Stream-URLs laufen ab – ältere Vorab-Infos verwerfen
+
+
+class GuildSettingsStore:
+    """
+    Einstellungen pro Server (Lautstärke, Loop-Voreinstellung, Sprache) in einer eigenen
+    SQLite-Datenbank statt in config.json. Gelesen wird aus dem Speicher; Änderungen werden
+    gesammelt und nach `flush_delay` Sekunden gebündelt in einem Worker-Thread geschrieben.
+    """
+
+    def __init__(self, path, flush_delay=2.0):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._settings = {}              # guild_id -> dict, nur bereits geladene Server
+        self._dirty = set()
+        self._flush_handle = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS guild_settings ("
+            "guild_id INTEGER PRIMARY KEY, volume INTEGER, loop INTEGER, language TEXT)"
+        )
+        self._db.commit()
+        # Eigene Verbindung zum Schreiben: mit WAL blockiert ein laufender Commit keine Lesezugriffe
+        self._write_db = sqlite3.connect(path, check_same_thread=False)
+
+    def load_all(self):
+        """Liest alle gespeicherten Server auf einmal (beim Start, im Worker-Thread)."""
+        with self._lock:
+            rows = self._db.execute("SELECT guild_id, volume, loop, language FROM guild_settings").fetchall()
+            for guild_id, volume, loop, language in rows:
+                self._settings.setdefault(guild_id, {'volume': volume, 'loop': bool(loop), 'language': language})
+        return len(rows)
+
+    def get(self, guild_id):
+        with self._lock:
+            settings = self._settings.get(guild_id)
+            if settings is None:
+                # Server war beim Start noch unbekannt – einzelne Zeile nachladen
+                row = self._db.execute(
+                    "SELECT volume, loop, language FROM guild_settings WHERE guild_id = ?", (guild_id,)
+                ).fetchone()
+                volume, loop, language = row if row else (None, None, None)
+                settings = self._settings[guild_id] = {'volume': volume, 'loop': bool(loop), 'language': language}
+            return dict(settings)
+
+    def set(self, guild_id, **values):
+        self.get(guild_id)
+        with self._lock:
+            self._settings[guild_id].update(values)
+            self._dirty.add(guild_id)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        asyncio.create_task(asyncio.to_thread(self.flush))
+
+    def flush(self):
+        # _lock nur zum Kopieren halten, damit get()/set() auf dem Event-Loop nicht auf die Platte
+        # warten; _write_lock hält parallele Flushes (Timer und Beenden) in ihrer Reihenfolge
+        with self._write_lock:
+            with self._lock:
+                rows = [
+                    (guild_id, self._settings[guild_id]['volume'], int(self._settings[guild_id]['loop']),
+                     self._settings[guild_id]['language'])
+                    for guild_id in self._dirty
+                ]
+                self._dirty.clear()
+            if not rows:
+                return
+            try:
+                self._write_db.executemany(
+                    "INSERT OR REPLACE INTO guild_settings (guild_id, volume, loop, language) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._write_db.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Error saving guild settings: {e}")
+
+
+settings_store_settings = config.get('settings_store', {})
+settings_store = GuildSettingsStore(
+    os.path.join(BASE_DIR, settings_store_settings.get('path', os.path.join(DATA_DIR, "settings.db"))),
+    flush_delay=settings_store_settings.get('flush_delay', 2)
+)
+
+
+class GuildPlayer:
+    """
+    Wiedergabe-Zustand eines Servers: Queue, Verlauf, Loop, Lautstärke, Jetzt-spielt-Nachricht
+    und Fortschrittsanzeige. Jeder Server bekommt eine eigene Instanz (siehe get_player).
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        settings = settings_store.get(guild_id)
+        self.volume = settings['volume'] or config.get('default_volume', 50)
+        self.language = settings['language']
+        self.text_channel_id = None      # Kanal für Jetzt-spielt- und Fehlermeldungen
+        self.song_queue = deque()        # Speichert QueueEntry-Objekte
+        self.played_songs = deque()
+        self.current = None              # QueueEntry des aktuellen Songs
+        self.now_playing_message = None
+        self.now_playing_view = None     # PlayerControls der Jetzt-spielt-Nachricht
+        self.is_looping = settings['loop']
+        self.stream_info = None          # info-Dict des aktuellen Songs, für Neustarts bei Lautstärke-Änderung
+        self.playback_started = 0        # time.monotonic() beim Start bzw. umgerechnet nach Neustart
+        self.paused_since = None
+        self.paused_total = 0
+        self.volume_pending = False      # Lautstärke im Pausenzustand geändert, beim Fortsetzen anwenden
+        self.playback_id = 0             # Zählt play_entry-Aufrufe, damit verspätete after-Callbacks erkennbar sind
+        self.stop_requested = False      # Song wurde per Skip beendet, nicht durch einen Stream-Abbruch
+        self.stream_retried = False
+        self.progress_duration = 0
+        self.progress_last_progress = -1
+        self.progress_last_paused = None
+        self.song_loading = False        # True, während play_next_song den nächsten Song lädt
+        # Vorab geladene Stream-Infos (info['url'], Titel, Dauer, Thumbnail) des nächsten Eintrags
+        self.prefetch_entry = None
+        self.prefetch_task = None
+        # Offene YouTube-Playlists, von denen erst ein Fenster in der Queue steht
+        self.playlist_cursors = []
+        self.refill_task = None
+
+    @property
+    def guild(self):
+        return bot.get_guild(self.guild_id)
+
+    @property
+    def lang(self):
+        return load_language(self.language) if self.language else lang
+
+    @property
+    def voice_client(self):
+        guild = self.guild
+        return guild.voice_client if guild else None
+
+    @property
+    def text_channel(self):
+        channel = bot.get_channel(self.text_channel_id) if self.text_channel_id else None
+        if channel is None and self.guild is not None and self.guild.text_channels:
+            channel = self.guild.text_channels[0]
+        return channel
+
+    async def send(self, *args, **kwargs):
+        channel = self.text_channel
+        if channel is None:
+            return None
+        return await channel.send(*args, **kwargs)
+
+    def schedule_lookahead(self):
+        """Startet die Auflösung der nächsten `lookahead` Einträge im Hintergrund."""
+        self.schedule_refill()
+        for entry in list(self.song_queue)[:lookahead]:
+            if not entry.resolved and entry.task is None:
+                entry.task = asyncio.create_task(_resolve_entry_task(entry))
+
+    def add_playlist_cursor(self, cursor, entries):
+        """Stellt das erste Fenster einer Playlist in die Queue; den Rest liefert der Cursor nach."""
+        self.enqueue(entries)
+        cursor.last_entry = entries[-1]
+        if not cursor.exhausted:
+            self.playlist_cursors.append(cursor)
+
+    def schedule_refill(self):
+        if self.playlist_cursors and (self.refill_task is None or self.refill_task.done()):
+            self.refill_task = asyncio.create_task(self.refill())
+
+    async def refill(self):
+        """Lädt weitere Einträge nach, sobald vor dem Fensterende eines Cursors weniger als die Hälfte übrig ist."""
+        for cursor in list(self.playlist_cursors):
+            ahead = self.entries_until(cursor.last_entry)
+            if ahead >= cursor.window // 2:
+                continue
+            entries = await cursor.fetch(cursor.window - ahead)
+            if cursor not in self.playlist_cursors:
+                # Queue wurde währenddessen geleert
+                continue
+            if entries:
+                # Direkt hinter den bisherigen Einträgen der Playlist, vor später hinzugefügten Songs
+                self.insert_entries(self.entries_until(cursor.last_entry), entries)
+                cursor.last_entry = entries[-1]
+                self.schedule_lookahead()
+            if cursor.exhausted:
+                self.playlist_cursors.remove(cursor)
+
+    async def wait_for_refill(self):
+        """
+        Ist die Queue leer, aber noch ein Playlist-Cursor offen (z. B. nach schnellen Skips), auf das
+        Nachladen warten. Ein bereits laufendes Nachladen wird abgewartet statt ein zweites zu starten.
+        """
+        while not self.song_queue and self.playlist_cursors:
+            self.schedule_refill()
+            task = self.refill_task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+                # Nachladen wurde durch clear() abgebrochen – Schleifenbedingung prüft die Cursor neu
+
+    def entries_until(self, entry):
+        """Anzahl der Queue-Einträge bis einschließlich `entry`; 0, wenn er nicht mehr in der Queue steht."""
+        try:
+            return self.song_queue.index(entry) + 1
+        except ValueError:
+            return 0
+
+    def cancel_pending_resolution(self):
+        for entry in self.song_queue:
+            if entry.task is not None and not entry.task.done():
+                entry.task.cancel()
+
+    def schedule_prefetch(self):
+        """Lädt die Stream-Infos des nächsten Queue-Eintrags, während der aktuelle Song läuft."""
+        entry = self.song_queue[0] if self.song_queue else None
+        if entry is self.prefetch_entry:
+            return
+        self.invalidate_prefetch()
+        if entry is not None:
+            self.prefetch_entry = entry
+            self.prefetch_task = asyncio.create_task(_prefetch(entry))
+
+    def invalidate_prefetch(self):
+        if self.prefetch_task is not None and not self.prefetch_task.done():
+            self.prefetch_task.cancel()
+        self.prefetch_entry = None
+        self.prefetch_task = None
+
+    async def take_prefetched(self, entry):
+        """Gibt die vorab geladenen Stream-Infos zurück, falls sie zu `entry` gehören."""
+        if entry is not self.prefetch_entry or self.prefetch_task is None:
+            # Queue wurde umsortiert oder geleert – Vorab-Infos gehören zu einem anderen Eintrag
+            self.invalidate_prefetch()
+            return None
+        task = self.prefetch_task
+        self.prefetch_entry = None
+        self.prefetch_task = None
+        try:
+            result = await task
+        except Exception as e:
+            logging.error(f"Error prefetching stream info: {e}")
+            return None
+        if result is None:
+            return None
+        fetched_at, info = result
+        if time.monotonic() - fetched_at > PREFETCH_MAX_AGE:
+            return None
+        return info
+
+    # Alle Änderungen an Queue, Verlauf und aktuellem Song laufen über diese Methoden, damit das
+    # Queue-Journal (siehe 4f) sie mitschreiben kann.
+    def enqueue(self, entries):
+        entries = list(entries)
+        self.song_queue.extend(entries)
+        queue_journal.record(self, 'add', entries=[entry.to_dict() for entry in entries])
+
+    def insert_entries(self, index, entries):
+        for offset, entry in enumerate(entries):
+            self.song_queue.insert(index + offset, entry)
+        queue_journal.record(self, 'insert', index=index, entries=[entry.to_dict() for entry in entries])
+
+    def pop_next(self):
+        entry = self.song_queue.popleft()
+        queue_journal.record(self, 'pop')
+        return entry
+
+    def push_front(self, entry):
+        self.song_queue.appendleft(entry)
+        queue_journal.record(self, 'push_front', entry=entry.to_dict())
+
+    def set_current(self, entry, remember=True):
+        """Setzt den aktuellen Song; mit remember=True wandert der bisherige in den Verlauf."""
+        if remember and self.current is not None:
+            self.played_songs.append(self.current)
+        self.current = entry
+        queue_journal.record(self, 'current', entry=entry.to_dict() if entry else None, remember=remember)
+
+    def pop_history(self):
+        entry = self.played_songs.pop()
+        queue_journal.record(self, 'history_pop')
+        return entry
+
+    def record_state(self, voice_channel_id=None):
+        """Schreibt Voice-Kanal und Wiedergabeposition ins Journal (voice_channel_id=None: nicht fortsetzen)."""
+        queue_journal.record(self, 'state', voice_channel_id=voice_channel_id,
+                             text_channel_id=self.text_channel_id, position=round(self.position(), 1))
+
+    def clear(self):
+        """Leert Queue und Verlauf und bricht laufende Hintergrund-Arbeit ab."""
+        self.cancel_pending_resolution()
+        self.invalidate_prefetch()
+        self.playlist_cursors = []
+        if self.refill_task is not None and not self.refill_task.done():
+            self.refill_task.cancel()
+        self.song_queue.clear()
+        self.played_songs.clear()
+        self.current = None
+        self.stream_info = None
+        queue_journal.record(self, 'clear')
+
+    def stop_playback(self):
+        """Beendet den aktuellen Song absichtlich (Skip), ohne Stream-Wiederherstellung."""
+        voice_client = self.voice_client
+        if voice_client is None:
+            return
+        self.stop_requested = True
+        voice_client.stop()
+
+    def stream_failed(self, error):
+        """
+        True, wenn der Song nicht regulär oder per Skip endete, sondern der Stream abgebrochen ist
+        (z. B. 403 oder abgelaufene URL) – dann lohnt ein Neustart mit frischer URL.
+        """
+        info = self.stream_info
+        if self.stop_requested or self.stream_retried or info is None or info.get('cached_path'):
+            return False
+        if error is not None:
+            return True
+        duration = info.get('duration')
+        return bool(duration) and self.position() < duration - 5
+
+    def start_clock(self, position=0):
+        self.playback_started = time.monotonic() - position
+        self.paused_since = None
+        self.paused_total = 0
+
+    def position(self):
+        """Abgespielte Sekunden des aktuellen Songs, Pausen nicht mitgezählt."""
+        now = self.paused_since if self.paused_since is not None else time.monotonic()
+        return max(0, now - self.playback_started - self.paused_total)
+
+    def pause(self):
+        voice_client = self.voice_client
+        if voice_client is None or not voice_client.is_playing():
+            return False
+        voice_client.pause()
+        self.paused_since = time.monotonic()
+        return True
+
+    def resume(self):
+        voice_client = self.voice_client
+        if voice_client is None or not voice_client.is_paused():
+            return False
+        if self.paused_since is not None:
+            self.paused_total += time.monotonic() - self.paused_since
+            self.paused_since = None
+        if self.volume_pending:
+            # Der Quellenwechsel (set_source) setzt die Wiedergabe selbst fort
+            self.apply_volume(force=True)
+        if voice_client.is_paused():
+            voice_client.resume()
+        return True
+
+    def apply_volume(self, force=False):
+        """
+        Überträgt self.volume auf die laufende Wiedergabe. Bei Opus-Ausgabe steckt die Lautstärke
+        im FFmpeg-Filter, daher wird FFmpeg an der aktuellen Position mit neuem Filter neu gestartet.
+        Im Pausenzustand wird das auf das Fortsetzen verschoben, außer force=True (aus resume()).
+        """
+        voice_client = self.voice_client
+        if voice_client is None or voice_client.source is None:
+            return
+        if isinstance(voice_client.source, discord.PCMVolumeTransformer):
+            voice_client.source.volume = self.volume / 100
+            return
+        if voice_client.is_paused() and not force:
+            self.volume_pending = True
+            return
+        self.volume_pending = False
+        if self.stream_info is None:
+            return
+        old_source = voice_client.source
+        voice_client.source = create_audio_source(self.stream_info, self.volume, self.position())
+        # Der Audio-Thread kann noch mitten in read() der alten Quelle stecken – FFmpeg erst
+        # etwas später beenden, sonst liest er b'' und hält den Song für beendet
+        bot.loop.call_later(1, old_source.cleanup)
+
+    def stop_progress(self):
+        progress_scheduler.discard(self)
+
+    def forget_now_playing(self):
+        """
+        Löst die Jetzt-spielt-Nachricht vom Player und gibt sie zurück. discord.py behält die View
+        einer gesendeten Nachricht sonst auch nach delete()/edit() im ViewStore; erst stop() entfernt sie.
+        """
+        if self.now_playing_view is not None:
+            self.now_playing_view.stop()
+            self.now_playing_view = None
+        message, self.now_playing_message = self.now_playing_message, None
+        return message
+
+
+players = {}                 # guild_id -> GuildPlayer
+
+
+def get_player(guild):
+    guild_id = guild if isinstance(guild, int) else guild.id
+    player = players.get(guild_id)
+    if player is None:
+        player = players[guild_id] = GuildPlayer(guild_id)
+    return player
+
+
+def guild_lang(guild):
+    """Sprachtexte des Servers; außerhalb von Servern (DMs) die Standardsprache."""
+    if guild is None:
+        return lang
+    return get_player(guild).lang
+
+
+##############################################
+# 4a. Persistenter Such-Cache (SQLite)
+##############################################
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class SearchCache:
+    """
+    Persistenter Cache für YouTube-Suchergebnisse, gespeichert nach normalisierter Suchanfrage
+    ("q:...") und Spotify-Track-ID ("sp:..."). Einträge ohne Treffer (url = NULL) werden als
+    Negativ-Cache mit kürzerer Lebensdauer gespeichert.
+    """
+
+    def __init__(self, path, max_entries=20000, ttl=30 * 86400, negative_ttl=6 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "key TEXT PRIMARY KEY, url TEXT, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_used ON search_cache(last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def _keys(query=None, spotify_id=None):
+        keys = []
+        if spotify_id:
+            keys.append(f"sp:{spotify_id}")
+        if query:
+            keys.append(f"q:{normalize_query(query)}")
+        return keys
+
+    def get(self, query=None, spotify_id=None):
+        """Gibt (gefunden, url) zurück; url ist None bei einem Negativ-Treffer."""
+        now = time.time()
+        with self._lock:
+            for key in self._keys(query, spotify_id):
+                row = self._db.execute(
+                    "SELECT url, created FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    continue
+                url, created = row
+                if now - created > (self.ttl if url else self.negative_ttl):
+                    self._db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    continue
+                self._db.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                if url:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                return True, url
+            self.misses += 1
+            return False, None
+
+    def put(self, url, query=None, spotify_id=None):
+        now = time.time()
+        with self._lock:
+            for key in self._keys(query, spotify_id):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, url, created, last_used) VALUES (?, ?, ?, ?)",
+                    (key, url, now, now)
+                )
+            self._db.commit()
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+
+    def _evict(self):
+        # LRU: älteste Einträge über max_entries hinaus löschen
+        self._db.execute(
+            "DELETE FROM search_cache WHERE key IN ("
+            "SELECT key FROM search_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        lookups = self.hits + self.negative_hits + self.misses
+        hit_rate = round(100 * (self.hits + self.negative_hits) / lookups) if lookups else 0
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': hit_rate
+        }
+
+    def export_json(self, path):
+        with self._lock:
+            rows = self._db.execute("SELECT key, url, created, last_used FROM search_cache").fetchall()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([
+                {'key': key, 'url': url, 'created': created, 'last_used': last_used}
+                for key, url, created, last_used in rows
+            ], f, ensure_ascii=False)
+        return len(rows)
+
+    def import_json(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        with self._lock:
+            # Vorhandene, neuere Einträge nicht überschreiben
+            self._db.executemany(
+                "INSERT INTO search_cache (key, url, created, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET url = excluded.url, created = excluded.created, "
+                "last_used = excluded.last_used WHERE excluded.created > search_cache.created",
+                [(e['key'], e.get('url'), e['created'], e.get('last_used', e['created'])) for e in entries]
+            )
+            self._db.commit()
+            self._evict()
+        return len(entries)
+
+
+search_cache_settings = config.get('search_cache', {})
+search_cache = SearchCache(
+    os.path.join(BASE_DIR, search_cache_settings.get('path', os.path.join(DATA_DIR, "search_cache.db"))),
+    max_entries=search_cache_settings.get('max_entries', 20000),
+    ttl=search_cache_settings.get('ttl_days', 30) * 86400,
+    negative_ttl=search_cache_settings.get('negative_ttl_hours', 6) * 3600
+)
+
+##############################################
+# 4b. Spotify-Hilfsfunktionen
 ##############################################
 async def get_spotify_track_info(url):
     def fetch_track_info():
         normalized_url = normalize_spotify_url(url)
         try:
-            info = sp.track(normalized_url)
+            with spotify_latency.time(method='track'):
+                info = get_spotify().track(normalized_url)
             track_name = info['name']
             artist_name = info['artists'][0]['name']
             album_art = info['album']['images'][0]['url']
@@ -164,116 +1155,629 @@ async def get_spotify_track_info(url):
     return await asyncio.to_thread(fetch_track_info)
 
 
+# Nur die Felder, die für die Queue gebraucht werden – spart den Großteil der Antwortgröße
+PLAYLIST_ITEM_FIELDS = "items(track(id,name,duration_ms,artists(name)))"
+PLAYLIST_PAGE_SIZE = 100
+
+
+class SpotifyPlaylistCache:
+    """
+    Bereits geladene Playlists nach ID. Ein Eintrag gilt, solange Spotifys `snapshot_id`
+    unverändert ist – eine unveränderte Playlist kostet dann nur noch einen Metadaten-Aufruf.
+    """
+
+    def __init__(self, max_entries=50):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()    # playlist_id -> (snapshot_id, tracks)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, playlist_id, snapshot_id):
+        item = self._entries.get(playlist_id)
+        if item is None or item[0] != snapshot_id:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(playlist_id)
+        self.hits += 1
+        return list(item[1])
+
+    def put(self, playlist_id, snapshot_id, tracks):
+        if not snapshot_id:
+            return
+        self._entries[playlist_id] = (snapshot_id, tuple(tracks))
+        self._entries.move_to_end(playlist_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+spotify_settings = config.get('spotify_playlists', {})
+playlist_cache = SpotifyPlaylistCache(max_entries=spotify_settings.get('cache_entries', 50))
+SPOTIFY_PAGE_CONCURRENCY = max(1, int(spotify_settings.get('page_concurrency', 4)))
+
+
+SPOTIFY_BATCH_SIZE = 50          # Maximum der Album- und Bibliotheks-Endpunkte
+spotify_market = config.get('spotify_market', 'US')
+
+
+def spotify_queue_item(track):
+    """(Suchbegriff, Spotify-ID, Dauer) eines Track-Objekts; None für lokale Dateien und Podcasts."""
+    if not track or not track.get('artists'):
+        print("DEBUG: Kein Track gefunden in einem Item!")
+        return None
+    query = f"{track['artists'][0]['name']} - {track['name']}"
+    return query, track.get('id'), (track.get('duration_ms') or 0) // 1000
+
+
+async def fetch_spotify_pages(fetch_page, total, page_size, start=0):
+    """Lädt die Seiten ab `start` parallel per Offset, sobald die Gesamtzahl bekannt ist."""
+    semaphore = asyncio.Semaphore(SPOTIFY_PAGE_CONCURRENCY)
+
+    async def load_page(offset):
+        async with semaphore:
+            return await asyncio.to_thread(fetch_page, offset)
+
+    return await asyncio.gather(*(load_page(offset) for offset in range(start, total, page_size)))
+
+
+async def get_spotify_album_tracks(url):
+    album_id = extract_spotify_id(url, 'album')
+
+    def fetch_album():
+        with spotify_latency.time(method='album'):
+            return get_spotify().album(album_id)
+
+    def fetch_page(offset):
+        with spotify_latency.time(method='album_tracks'):
+            return get_spotify().album_tracks(album_id, limit=SPOTIFY_BATCH_SIZE, offset=offset)
+
+    album = await asyncio.to_thread(fetch_album)
+    # Die erste Seite steckt bereits in der Album-Antwort
+    first_page = album['tracks']
+    pages = [first_page] + await fetch_spotify_pages(
+        fetch_page, first_page['total'], SPOTIFY_BATCH_SIZE, start=len(first_page['items'])
+    )
+    return [track for page in pages for track in page['items']]
+
+
+async def get_spotify_artist_tracks(url):
+    artist_id = extract_spotify_id(url, 'artist')
+
+    def fetch_top_tracks():
+        with spotify_latency.time(method='artist_top_tracks'):
+            return get_spotify().artist_top_tracks(artist_id, country=spotify_market)['tracks']
+
+    return await asyncio.to_thread(fetch_top_tracks)
+
+
+async def get_spotify_saved_tracks():
+    """"Lieblingssongs" des Spotify-Kontos, mit dem der Bot autorisiert wurde."""
+    def fetch_page(offset):
+        with spotify_latency.time(method='saved_tracks'):
+            return get_spotify().current_user_saved_tracks(limit=SPOTIFY_BATCH_SIZE, offset=offset)
+
+    first_page = await asyncio.to_thread(fetch_page, 0)
+    pages = [first_page] + await fetch_spotify_pages(
+        fetch_page, first_page['total'], SPOTIFY_BATCH_SIZE, start=len(first_page['items'])
+    )
+    return [item['track'] for page in pages for item in page['items']]
+
+
+async def get_spotify_collection_tracks(url):
+    """Queue-Einträge für Alben, Künstler (Top-Tracks) und die Lieblingssongs-Bibliothek."""
+    try:
+        if 'open.spotify.com/album' in url:
+            tracks = await get_spotify_album_tracks(url)
+        elif 'open.spotify.com/artist' in url:
+            tracks = await get_spotify_artist_tracks(url)
+        else:
+            tracks = await get_spotify_saved_tracks()
+        items = [item for item in map(spotify_queue_item, tracks) if item]
+        print(f"DEBUG: Total tracks found: {len(items)}")
+        return items
+    except Exception as e:
+        logging.error(f"Error retrieving Spotify tracks: {e}")
+        return None
+
+
 async def get_spotify_playlist_tracks(url):
-    def fetch_tracks():
-        try:
-            normalized_url = normalize_spotify_url(url)
-            # Extrahiere Playlist-ID
-            playlist_id = normalized_url.split("playlist/")[1].split("?")[0]
-            print(f"DEBUG: Playlist ID: {playlist_id}")
-            results = sp.playlist_items(playlist_id)
-            tracks = []
-            while results:
-                for item in results['items']:
-                    track = item['track']
-                    if track is None:
-                        print("DEBUG: Kein Track gefunden in einem Item!")
-                        continue
-                    artist = track['artists'][0]['name']
-                    title = track['name']
-                    print(f"DEBUG: Gefundener Track: {artist} - {title}")
-                    tracks.append(f"{artist} - {title}")
-                if results.get('next'):
-                    results = sp.next(results)
-                else:
-                    results = None
-            print(f"DEBUG: Total tracks found: {len(tracks)}")
+    def fetch_metadata(playlist_id):
+        with spotify_latency.time(method='playlist'):
+            return get_spotify().playlist(playlist_id, fields="snapshot_id,tracks.total")
+
+    def fetch_page(playlist_id, offset):
+        with spotify_latency.time(method='playlist_items'):
+            return get_spotify().playlist_items(
+                playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=PLAYLIST_PAGE_SIZE, offset=offset,
+                additional_types=('track',)
+            )
+
+    try:
+        normalized_url = normalize_spotify_url(url)
+        # Extrahiere Playlist-ID
+        playlist_id = normalized_url.split("playlist/")[1].split("?")[0]
+        print(f"DEBUG: Playlist ID: {playlist_id}")
+        metadata = await asyncio.to_thread(fetch_metadata, playlist_id)
+        snapshot_id = metadata.get('snapshot_id')
+        tracks = playlist_cache.get(playlist_id, snapshot_id)
+        if tracks is not None:
+            print(f"DEBUG: Playlist {playlist_id} unverändert, {len(tracks)} Tracks aus dem Cache")
             return tracks
-        except Exception as e:
-            logging.error(f"Error retrieving Spotify playlist tracks: {e}")
-            print(f"DEBUG: Error retrieving Spotify playlist tracks: {e}")
-            return None
 
-    return await asyncio.to_thread(fetch_tracks)
+        # Gesamtzahl ist bekannt -> alle Seiten parallel per Offset statt nacheinander über 'next'
+        pages = await fetch_spotify_pages(
+            lambda offset: fetch_page(playlist_id, offset), metadata['tracks']['total'], PLAYLIST_PAGE_SIZE
+        )
+        tracks = [
+            item for item in (spotify_queue_item(entry.get('track')) for page in pages for entry in page['items'])
+            if item
+        ]
+        print(f"DEBUG: Total tracks found: {len(tracks)}")
+        playlist_cache.put(playlist_id, snapshot_id, tracks)
+        return tracks
+    except Exception as e:
+        logging.error(f"Error retrieving Spotify playlist tracks: {e}")
+        print(f"DEBUG: Error retrieving Spotify playlist tracks: {e}")
+        return None
 
 ##############################################
-# 4b. YouTube-Hilfsfunktionen (erweiterte Suchvarianten)
+# 4c. YouTube-Hilfsfunktionen (erweiterte Suchvarianten)
 ##############################################
-async def get_youtube_url(query):
-    return await asyncio.to_thread(get_youtube_url_sync, query)
+class ExtractionPool:
+    """
+    Eigener Pool für yt-dlp-Arbeit statt des Standard-Executors von asyncio.to_thread. Wartende
+    Aufträge werden nach Klasse vergeben – laufende Wiedergabe vor Prefetch vor Suche vor
+    Anzeige-Metadaten –, jede Klasse hat ein eigenes Limit, ein Worker bleibt für die Wiedergabe
+    frei, und abgebrochene Aufträge werden verworfen, bevor sie einen Worker belegen.
+    Aufträge mit Schlüssel (z. B. der Queue-Eintrag) lassen sich per promote() auf Wiedergabe-
+    Priorität hochstufen, sobald ein Trackwechsel auf genau diesen Vorab-Auftrag wartet.
+    Im Modus "process" laufen die extract_info-Aufrufe selbst in Worker-Prozessen (eigener GIL);
+    Caches und Trefferbewertung bleiben im Bot-Prozess.
+    """
+    PRIORITIES = ('playback', 'prefetch', 'search', 'metadata')
+
+    def __init__(self, workers=4, limits=None, mode='thread'):
+        self.workers = max(1, workers)
+        self.limits = dict.fromkeys(self.PRIORITIES, self.workers)
+        self.limits.update(limits or {})
+        self.mode = mode
+        self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract")
+        self._processes = None
+        self._processes_lock = threading.Lock()
+        self._pending = []               # Heap aus (Rang, Reihenfolge, Klasse, Funktion, Argumente, Future, Schlüssel)
+        self._urgent = set()             # Schlüssel, auf die gerade eine Wiedergabe wartet
+        self._order = itertools.count()
+        self.running = dict.fromkeys(self.PRIORITIES, 0)
+        self.cancelled = 0
+
+    async def run(self, priority, func, *args, key=None):
+        """Führt func(*args) im Pool aus. Bricht der Aufrufer ab, startet ein noch wartender Auftrag nicht mehr."""
+        if key is not None and key in self._urgent:
+            priority = 'playback'
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._pending, (self.PRIORITIES.index(priority), next(self._order), priority, func, args, future, key))
+        self._dispatch()
+        return await future
+
+    def promote(self, key):
+        """
+        Stuft wartende und bis release(key) neu eingereihte Aufträge zu `key` auf Wiedergabe-Priorität
+        hoch. Bereits laufende Aufträge bleiben unverändert, sie belegen ihren Worker ohnehin schon.
+        """
+        self._urgent.add(key)
+        promoted = False
+        for index, (_, order, priority, func, args, future, job_key) in enumerate(self._pending):
+            if job_key is key and priority != 'playback' and not future.done():
+                self._pending[index] = (0, order, 'playback', func, args, future, job_key)
+                promoted = True
+        if promoted:
+            heapq.heapify(self._pending)
+            self._dispatch()
+
+    def release(self, key):
+        self._urgent.discard(key)
+
+    def pending(self):
+        counts = dict.fromkeys(self.PRIORITIES, 0)
+        for _, _, priority, _, _, future, _ in self._pending:
+            if not future.done():
+                counts[priority] += 1
+        return counts
+
+    def _dispatch(self):
+        deferred = []
+        while self._pending and sum(self.running.values()) < self.workers:
+            job = heapq.heappop(self._pending)
+            _, _, priority, func, args, future, _ = job
+            if future.done():
+                # Aufrufer abgebrochen (Seite gewechselt, Queue geleert, Prefetch veraltet)
+                self.cancelled += 1
+                continue
+            busy = sum(self.running.values())
+            if self.running[priority] >= self.limits[priority] or (
+                    priority != 'playback' and busy >= max(1, self.workers - 1)):
+                deferred.append(job)
+                continue
+            self._start(priority, func, args, future)
+        for job in deferred:
+            heapq.heappush(self._pending, job)
+
+    def _start(self, priority, func, args, future):
+        self.running[priority] += 1
+        work = asyncio.get_running_loop().run_in_executor(self._threads, func, *args)
+
+        def finished(work):
+            self.running[priority] -= 1
+            if not future.done():
+                if work.cancelled():
+                    future.cancel()
+                elif work.exception() is not None:
+                    future.set_exception(work.exception())
+                else:
+                    future.set_result(work.result())
+            self._dispatch()
+
+        work.add_done_callback(finished)
+
+    def extract(self, profile, url):
+        """extract_info aus einem Pool-Thread heraus; im Prozessmodus in einem Worker-Prozess."""
+        if self.mode != 'process':
+            return extract_info_job(profile, url)
+        # "spawn" führt in jedem neuen Worker das Hauptmodul erneut aus – beim Bot hieße das
+        # Konfiguration, Datenbanken und Bot-Objekt pro Prozess. Worker entstehen nur innerhalb von
+        # submit(), solange gibt sich deshalb das seiteneffektfreie ytdl_jobs als Hauptmodul aus.
+        main_module = sys.modules['__main__']
+        with self._processes_lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            main_spec = getattr(main_module, '__spec__', None)
+            main_module.__spec__ = ytdl_jobs.__spec__
+            try:
+                job = self._processes.submit(extract_info_job, profile, url)
+            finally:
+                main_module.__spec__ = main_spec
+        return job.result()
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+
+extraction_settings = config.get('extraction_pool', {})
+extraction_limits = {'search': int(config.get('resolve_concurrency', 3)), 'prefetch': 1, 'metadata': 1}
+extraction_limits.update(extraction_settings.get('limits', {}))
+extraction_pool = ExtractionPool(
+    workers=int(extraction_settings.get('workers', 4)),
+    limits=extraction_limits,
+    mode=extraction_settings.get('mode', 'thread')
+)
 
+# Titel und Dauer bereits bekannter Videos (aus Suche, Playlist oder Stream-Infos), damit die
+# Queue-Anzeige ohne erneutes extract_info auskommt. Begrenzt, älteste Einträge fliegen zuerst.
+TRACK_METADATA_LIMIT = 10000
+track_metadata = OrderedDict()
+_track_metadata_lock = threading.Lock()
 
-def get_youtube_url_sync(query):
-    if query in url_cache:
-        return url_cache[query]
-    ydl_opts = {
-    'format': 'bestaudio/best',
-    'noplaylist': True,
-    'quiet': True,
-    'no_warnings': True,
-    'ignoreerrors': True,
-    'http_headers': {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
-        }
-    }
-    search_queries = [
-        f"{query} full song",
-        f"{query} audio",
-        f"{query} official video",
-        f"{query} official audio"
-    ]
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        for sq in search_queries:
-            try:
-                print(f"DEBUG: Suche YouTube nach: {sq}")
-                info = ydl.extract_info(f"ytsearch:{sq}", download=False)
-                entries = info.get('entries', [])
-                if entries:
-                    video_url = entries[0].get('webpage_url')
-                    if video_url:
-                        print(f"DEBUG: Gefunden: {video_url}")
-                        url_cache[query] = video_url
-                        return video_url
-            except Exception as e:
-                logging.error(f"Error retrieving YouTube link for query '{sq}': {e}")
-                continue
-        try:
-            print(f"DEBUG: Fallback Suche YouTube nach: {query}")
-            info = ydl.extract_info(f"ytsearch:{query}", download=False)
-            entries = info.get('entries', [])
-            if entries:
-                video_url = entries[0].get('webpage_url')
-                if video_url:
-                    print(f"DEBUG: Fallback Gefunden: {video_url}")
-                    url_cache[query] = video_url
-                    return video_url
-        except Exception as e:
-            logging.error(f"Fallback error for query '{query}': {e}")
-    return None
 
+def remember_metadata(url, title, duration):
+    if not url or not title:
+        return
+    with _track_metadata_lock:
+        track_metadata[url] = (title, duration or 0)
+        track_metadata.move_to_end(url)
+        while len(track_metadata) > TRACK_METADATA_LIMIT:
+            track_metadata.popitem(last=False)
 
-async def get_youtube_playlist_urls(url):
-    def fetch_playlist_urls():
-        ydl_opts = {'quiet': True, 'extract_flat': True, 'skip_download': True}
+
+def get_metadata(url):
+    with _track_metadata_lock:
+        return track_metadata.get(url)
+
+
+class StreamUrlCache:
+    """
+    Aufgelöste Stream-URLs samt Format-Infos, nach Video-ID. Ein Eintrag gilt bis zum
+    `expire`-Parameter der googlevideo-URL abzüglich `margin`, sodass Loop und Zurückspringen
+    ohne erneutes extract_info starten.
+    """
+    # Nur diese Felder werden aus dem (großen) yt-dlp-Ergebnis aufbewahrt
+    INFO_KEYS = STREAM_INFO_KEYS
+
+    def __init__(self, max_entries=1000, margin=600, default_ttl=PREFETCH_MAX_AGE):
+        self.max_entries = max_entries
+        self.margin = margin
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()    # video_id -> (gültig bis, info)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def expires_at(self, url):
+        match = re.search(r"[?&/]expire[=/](\d+)", url or '')
+        if match:
+            return int(match.group(1)) - self.margin
+        return time.time() + self.default_ttl
+
+    def get(self, video_id):
+        if not video_id:
+            return None
+        with self._lock:
+            item = self._entries.get(video_id)
+            if item is None:
+                self.misses += 1
+                return None
+            valid_until, info = item
+            if time.time() >= valid_until:
+                del self._entries[video_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(video_id)
+            self.hits += 1
+            return dict(info)
+
+    def put(self, video_id, info):
+        if not video_id or not info.get('url'):
+            return dict(info)
+        info = {key: info.get(key) for key in self.INFO_KEYS}
+        with self._lock:
+            self._entries[video_id] = (self.expires_at(info['url']), info)
+            self._entries.move_to_end(video_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(info)
+
+    def invalidate(self, video_id):
+        with self._lock:
+            self._entries.pop(video_id, None)
+
+
+stream_cache_settings = config.get('stream_cache', {})
+stream_cache = StreamUrlCache(
+    max_entries=stream_cache_settings.get('max_entries', 1000),
+    margin=stream_cache_settings.get('expiry_margin', 600)
+)
+
+
+async def get_youtube_url(query, spotify_id=None, duration=None, priority='search', key=None):
+    return await extraction_pool.run(priority, get_youtube_url_sync, query, spotify_id, duration, key=key)
+
+
+# Versionen, die bei Spotify-Suchen meist nicht gemeint sind (außer sie stehen in der Anfrage)
+UNWANTED_VERSION_WORDS = ('live', 'cover', 'karaoke', 'remix', 'instrumental', 'nightcore',
+                          'sped up', 'slowed', 'reverb', '8d', 'reaction')
+search_candidates = max(1, int(config.get('search_candidates', 5)))
+
+
+def score_search_result(query, entry, duration=None):
+    """
+    Bewertet einen Suchtreffer: Titel-Ähnlichkeit, Anteil der Suchbegriffe in Titel/Kanal
+    und – falls bekannt (Spotify) – wie nah die Länge an der erwarteten Dauer liegt.
+    """
+    normalized = normalize_query(query)
+    title = normalize_query(entry.get('title') or '')
+    channel = normalize_query(entry.get('channel') or entry.get('uploader') or '')
+    score = difflib.SequenceMatcher(None, normalized, title).ratio()
+    query_words = set(re.findall(r"\w+", normalized))
+    if query_words:
+        score += len(query_words & set(re.findall(r"\w+", f"{title} {channel}"))) / len(query_words)
+    for word in UNWANTED_VERSION_WORDS:
+        if re.search(rf"\b{word}\b", title) and not re.search(rf"\b{word}\b", normalized):
+            score -= 0.5
+    if channel.endswith(' - topic') or 'official audio' in title:
+        score += 0.25
+    candidate_duration = entry.get('duration')
+    if duration and candidate_duration:
+        # Volle Punktzahl bei gleicher Länge, 0 ab ~10 % (mind. 15 s) Abweichung
+        tolerance = max(15, duration * 0.1)
+        score += max(0.0, 1.0 - abs(candidate_duration - duration) / tolerance)
+    return score
+
+
+def get_youtube_url_sync(query, spotify_id=None, duration=None):
+    found, cached_url = search_cache.get(query, spotify_id)
+    if found:
+        return cached_url
+    try:
+        # Eine flache Suche liefert mehrere Kandidaten samt Titel und Dauer in einem Aufruf
+        print(f"DEBUG: Suche YouTube nach: {query}")
+        with extract_latency.time(profile='search'):
+            info = extraction_pool.extract('search', f"ytsearch{search_candidates}:{query}")
+    except Exception as e:
+        # Fehlgeschlagene Suchen (z. B. Netzwerkausfall) nie negativ cachen
+        logging.error(f"Error retrieving YouTube link for query '{query}': {e}")
+        return None
+    if info is None:
+        return None
+    entries = [entry for entry in info.get('entries') or [] if entry and entry.get('id')]
+    if not entries:
+        # Negativ-Cache: nur bei echten "kein Treffer"-Antworten, nicht bei Netzwerkfehlern
+        search_cache.put(None, query, spotify_id)
+        return None
+    best = max(entries, key=lambda entry: score_search_result(query, entry, duration))
+    video_url = f"https://www.youtube.com/watch?v={best['id']}"
+    print(f"DEBUG: Gefunden: {video_url} ({best.get('title')})")
+    remember_metadata(video_url, best.get('title'), best.get('duration'))
+    search_cache.put(video_url, query, spotify_id)
+    return video_url
+
+
+youtube_playlist_window = max(2, int(config.get('youtube_playlist_window', 50)))
+
+
+class YoutubePlaylistCursor:
+    """
+    Liest eine YouTube-Playlist bzw. einen Mix seitenweise: Mit process=False liefert yt-dlp
+    die Einträge als Generator und lädt weitere Seiten erst beim Weiterlesen. In der Queue steht
+    nur ein Fenster von `window` Einträgen, der Rest wird nachgeladen, während die Queue abläuft.
+    """
+
+    def __init__(self, url, requester_id, window=youtube_playlist_window):
+        self.url = url
+        self.requester_id = requester_id
+        self.window = window
+        self.last_entry = None           # Letzter bereits in die Queue gestellter Eintrag
+        self.exhausted = False
+        self._entries = None
+        self._ydl = None
+        self._lock = asyncio.Lock()
+
+    def _open(self):
+        # Eigene Instanz: der Generator wird später aus beliebigen Worker-Threads weitergelesen
+        self._ydl = load_yt_dlp().YoutubeDL(YDL_PROFILES['flat'])
+        info = self._ydl.extract_info(self.url, download=False, process=False)
+        # watch?v=…&list=… verweist zunächst nur auf die Playlist
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = self._ydl.extract_info(info['url'], download=False, process=False)
+        return iter(info.get('entries') or ())
+
+    def _read(self, count):
+        videos = []
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                entries = info.get('entries', [])
-                return [f"https://www.youtube.com/watch?v={entry['id']}"
-                        for entry in entries if 'id' in entry]
+            with extract_latency.time(profile='flat'):
+                if self._entries is None:
+                    self._entries = self._open()
+                for entry in self._entries:
+                    if entry and entry.get('id'):
+                        # (url, titel, dauer) – Titel und Dauer liefert extract_flat bereits mit
+                        videos.append((f"https://www.youtube.com/watch?v={entry['id']}",
+                                       entry.get('title'), entry.get('duration')))
+                        if len(videos) >= count:
+                            return videos
         except Exception as e:
-            logging.error(f"Error retrieving YouTube playlist URLs: {e}")
-            return None
-    return await asyncio.to_thread(fetch_playlist_urls)
+            logging.error(f"Error retrieving YouTube playlist entries: {e}")
+        self.exhausted = True
+        self._entries = self._ydl = None
+        return videos
+
+    async def fetch(self, count):
+        """Die nächsten `count` Einträge als QueueEntry-Objekte (weniger am Ende der Playlist)."""
+        async with self._lock:
+            if self.exhausted or count <= 0:
+                return []
+            videos = await extraction_pool.run('search', self._read, count)
+        return [QueueEntry(video_url, title=title, duration=duration, requester_id=self.requester_id)
+                for video_url, title, duration in videos]
+
+
+class QueueEntry:
+    """
+    Kompakter Queue-Eintrag: nur IDs und bereits bekannte Metadaten, kein commands.Context.
+    Solange `resolved` False ist, enthält `query` die noch offene YouTube-Suche
+    (z. B. "Künstler - Titel" aus Spotify); `source` wird dann erst im Lookahead-Fenster gesetzt.
+    """
+    __slots__ = ('source', 'query', 'spotify_id', 'title', 'duration', 'thumbnail',
+                 'requester_id', 'resolved', 'task')
+
+    def __init__(self, source=None, query=None, title=None, duration=None, thumbnail=None,
+                 requester_id=None, spotify_id=None):
+        self.source = source
+        self.query = query
+        self.spotify_id = spotify_id
+        self.title = title
+        self.duration = duration
+        self.thumbnail = thumbnail
+        self.requester_id = requester_id
+        self.resolved = source is not None
+        self.task = None
+
+    def to_dict(self):
+        """Kompakte Form für das Queue-Journal; leere Felder entfallen."""
+        return {
+            key: value for key, value in (
+                ('source', self.source), ('query', self.query), ('spotify_id', self.spotify_id),
+                ('title', self.title), ('duration', self.duration), ('thumbnail', self.thumbnail),
+                ('requester_id', self.requester_id)
+            ) if value is not None
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def apply_info(self, info):
+        """Übernimmt Titel, Dauer und Thumbnail aus einem yt-dlp-Ergebnis."""
+        self.title = info.get('title') or self.title
+        self.duration = info.get('duration') or self.duration
+        self.thumbnail = info.get('thumbnail') or self.thumbnail
+
+
+async def resolve_entry(entry, priority='playback'):
+    """Löst einen Eintrag bei Bedarf auf und gibt die YouTube-URL zurück (None ohne Treffer)."""
+    if not entry.resolved:
+        if entry.task is None:
+            entry.task = asyncio.create_task(_resolve_entry_task(entry, priority))
+        await asyncio.shield(entry.task)
+    return entry.source
+
+
+async def _resolve_entry_task(entry, priority='search'):
+    source = await get_youtube_url(entry.query, entry.spotify_id, entry.duration, priority, key=entry)
+    if source is None:
+        print(f"DEBUG: Kein YouTube-Ergebnis für: {entry.query}")
+        return
+    entry.source = source
+    entry.resolved = True
+    metadata = get_metadata(source)
+    if metadata:
+        entry.title, entry.duration = metadata
+    entry.task = None
+
+
+def fetch_stream_info(url, refresh=False):
+    """Stream-Infos für `url`; refresh=True ignoriert zwischengespeicherte Stream-URLs (z. B. nach 403)."""
+    video_id = extract_youtube_video_id(url)
+    cached = audio_cache.lookup(video_id)
+    if cached is not None:
+        print(f"DEBUG: Aus Audio-Cache: {url}")
+        return cached
+    if refresh:
+        stream_cache.invalidate(video_id)
+    else:
+        cached = stream_cache.get(video_id)
+        if cached is not None:
+            return cached
+    try:
+        print(f"DEBUG: yt-dlp ruft ab: {url}")
+        with extract_latency.time(profile='stream'):
+            info = extraction_pool.extract('stream', url)
+        if info:
+            remember_metadata(url, info.get('title'), info.get('duration'))
+            info = stream_cache.put(video_id or info.get('id'), info)
+        return info
+    except Exception as e:
+        logging.error(f"yt-dlp Fehler: {e}")
+        return None
+
+
+async def _prefetch(entry):
+    url = await resolve_entry(entry, 'prefetch')
+    if url is None:
+        return None
+    info = await extraction_pool.run('prefetch', fetch_stream_info, url, key=entry)
+    if info is None:
+        return None
+    print(f"DEBUG: Vorab geladen: {info.get('title')}")
+    return time.monotonic(), info
+
+
+def extract_youtube_video_id(url):
+    if not url:
+        return None
+    if "watch?v=" in url:
+        return url.split("watch?v=")[1].split("&")[0] or None
+    if "youtu.be/" in url:
+        return url.split("youtu.be/")[1].split("?")[0] or None
+    return None
 
 
 def extract_individual_youtube_url(url):
     try:
-        if "watch?v=" in url:
-            video_id = url.split("watch?v=")[1].split("&")[0]
-        elif "youtu.be/" in url:
-            video_id = url.split("youtu.be/")[1].split("?")[0]
-        else:
+        video_id = extract_youtube_video_id(url)
+        if video_id is None:
             return None
         return f"https://www.youtube.com/watch?v={video_id}"
     except Exception as e:
@@ -282,48 +1786,119 @@ def extract_individual_youtube_url(url):
 
 
 async def get_song_info_async(url):
-    def fetch_song_info():
-        ydl_opts = {'format': 'bestaudio/best', 'noplaylist': True, 'quiet': True}
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                return ydl.extract_info(url, download=False)
-        except Exception as e:
-            logging.error(f"Error fetching song info: {e}")
-            return None
-    return await asyncio.to_thread(fetch_song_info)
+    return await extraction_pool.run('metadata', fetch_stream_info, url)
 
 ##############################################
-# 4c. Fortschrittsanzeige
+# 4d. Fortschrittsanzeige
 ##############################################
-@tasks.loop(seconds=5)
-async def update_progress_loop(ctx):
-    global now_playing_message, progress_start_time, progress_duration, progress_last_progress
-    if ctx.voice_client is None or not ctx.voice_client.is_connected():
-        update_progress_loop.cancel()
-        return
-    if not ctx.voice_client.is_playing() and not ctx.voice_client.is_paused():
-        update_progress_loop.cancel()
-        return
-    elapsed = time.time() - progress_start_time
-    progress = min(elapsed / progress_duration, 1.0)
-    minutes, seconds = divmod(int(elapsed), 60)
-    total_minutes, total_seconds = divmod(int(progress_duration), 60)
-    progress_bar = create_progress_bar(progress)
-    new_progress_level = int(progress * 100) // 5
-    if new_progress_level != progress_last_progress:
-        progress_last_progress = new_progress_level
-        embed = now_playing_message.embeds[0]
+class ProgressScheduler:
+    """
+    Ein zentraler Task aktualisiert die Jetzt-spielt-Nachrichten aller Server. Das Intervall pro
+    Nachricht wächst mit der Zahl aktiver Player, sodass alle Edits zusammen innerhalb von
+    `edit_budget` Edits pro `window` Sekunden bleiben. Pausierte Player werden nur einmal
+    aktualisiert, Player ohne menschliche Zuhörer gar nicht.
+    """
+
+    MAX_EDITS_PER_TICK = 10
+
+    def __init__(self, base_interval=5, edit_budget=60, window=60):
+        self.base_interval = base_interval
+        self.edit_budget = max(1, edit_budget)
+        self.window = window
+        self.due = {}                # guild_id -> nächster Zeitpunkt (time.monotonic)
+        self.recent_edits = deque()  # Zeitpunkte der Edits im aktuellen Fenster
+        self.task = None
+
+    def track(self, player):
+        player.progress_last_progress = -1
+        player.progress_last_paused = None
+        self.due[player.guild_id] = 0
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def discard(self, player):
+        self.due.pop(player.guild_id, None)
+
+    def interval(self):
+        active = max(1, len(self.due))
+        interval = max(self.base_interval, self.window * active / self.edit_budget)
+        if len(self.recent_edits) >= self.edit_budget:
+            # Budget aufgebraucht – bis zum Ende des Fensters strecken
+            interval += self.window
+        return interval
+
+    async def _run(self):
+        while self.due:
+            now = time.monotonic()
+            while self.recent_edits and now - self.recent_edits[0] > self.window:
+                self.recent_edits.popleft()
+            remaining = self.edit_budget - len(self.recent_edits)
+            due = sorted((t, guild_id) for guild_id, t in self.due.items() if t <= now)
+            if due and remaining > 0:
+                # Höchstens MAX_EDITS_PER_TICK pro Sekunde, damit keine Edit-Spitzen entstehen
+                batch = [guild_id for _, guild_id in due[:min(remaining, self.MAX_EDITS_PER_TICK)]]
+                results = await asyncio.gather(*(self._update(guild_id) for guild_id in batch))
+                for guild_id, result in zip(batch, results):
+                    if guild_id not in self.due:
+                        continue
+                    if result is None:
+                        self.due.pop(guild_id, None)
+                    else:
+                        # Bei Fehlern (z. B. Rate-Limit) deutlich länger warten
+                        factor = 4 if result == 'error' else 1
+                        self.due[guild_id] = time.monotonic() + self.interval() * factor
+            await asyncio.sleep(1)
+
+    async def _update(self, guild_id):
+        """Gibt None zurück, wenn der Player nicht mehr verfolgt werden soll."""
+        player = players.get(guild_id)
+        if player is None or player.now_playing_message is None:
+            return None
+        voice_client = player.voice_client
+        if voice_client is None or not voice_client.is_connected():
+            return None
+        if not voice_client.is_playing() and not voice_client.is_paused():
+            return None
+        paused = voice_client.is_paused()
+        if paused and player.progress_last_paused:
+            return 'skipped'
+        channel = getattr(voice_client, 'channel', None)
+        if channel is not None and not any(not member.bot for member in channel.members):
+            return 'skipped'
+        elapsed = player.position()
+        progress = min(elapsed / player.progress_duration, 1.0) if player.progress_duration else 0
+        new_progress_level = int(progress * 100) // 5
+        if new_progress_level == player.progress_last_progress and paused == player.progress_last_paused:
+            # Nichts Sichtbares hat sich geändert – Edit einsparen
+            return 'skipped'
+        player.progress_last_progress = new_progress_level
+        player.progress_last_paused = paused
+        minutes, seconds = divmod(int(elapsed), 60)
+        total_minutes, total_seconds = divmod(int(player.progress_duration), 60)
+        embed = player.now_playing_message.embeds[0]
         embed.clear_fields()
         embed.add_field(name="Dauer", value=f"{minutes}:{seconds:02d} / {total_minutes}:{total_seconds:02d}", inline=True)
-        embed.add_field(name="Fortschritt", value=progress_bar, inline=False)
-        embed.title = "⏸️ Jetzt spielt 🎶" if ctx.voice_client.is_paused() else "Jetzt spielt 🎶"
+        embed.add_field(name="Fortschritt", value=create_progress_bar(progress), inline=False)
+        embed.title = "⏸️ Jetzt spielt 🎶" if paused else "Jetzt spielt 🎶"
+        self.recent_edits.append(time.monotonic())
         try:
-            await now_playing_message.edit(embed=embed)
+            await player.now_playing_message.edit(embed=embed)
         except discord.errors.NotFound:
-            update_progress_loop.cancel()
-            return
-    if elapsed >= progress_duration:
-        update_progress_loop.cancel()
+            return None
+        except discord.errors.HTTPException as e:
+            logging.error(f"Error updating now playing message: {e}")
+            return 'error'
+        if player.progress_duration and elapsed >= player.progress_duration:
+            return None
+        return 'edited'
+
+
+progress_settings = config.get('progress_updates', {})
+progress_scheduler = ProgressScheduler(
+    base_interval=progress_settings.get('base_interval', 5),
+    edit_budget=progress_settings.get('edit_budget', 60),
+    window=progress_settings.get('budget_window', 60)
+)
 
 
 def create_progress_bar(progress):
@@ -332,61 +1907,531 @@ def create_progress_bar(progress):
     bar = '▰' * filled + '▱' * (length - filled)
     return f"{bar} {int(progress * 100)}%"
 
+##############################################
+# 4e. Lokaler Audio-Cache (Opus)
+##############################################
+class AudioCache:
+    """
+    Optionaler Festplatten-Cache für häufig gespielte Songs, bereits als Opus gespeichert und
+    nach YouTube-Video-ID abgelegt. Ein Song wird erst nach `min_plays` Wiedergaben im
+    Hintergrund per FFmpeg in den Cache geschrieben; über `max_size` hinaus werden die am
+    längsten nicht gespielten Dateien gelöscht. Titel, Dauer und Thumbnail liegen mit im Index,
+    sodass ein Treffer ganz ohne yt-dlp-Abfrage abgespielt werden kann.
+    """
+
+    def __init__(self, path, enabled=False, max_size=2048 * 1024 * 1024, min_plays=2,
+                 max_duration=900, bitrate=128, fill_concurrency=1):
+        self.path = path
+        self.enabled = enabled
+        self.max_size = max_size
+        self.min_plays = min_plays
+        self.max_duration = max_duration
+        self.bitrate = bitrate
+        self.hits = 0
+        self.misses = 0
+        self._fill_semaphore = asyncio.Semaphore(max(1, fill_concurrency))
+        self._filling = set()
+        self._lock = threading.Lock()
+        if not enabled:
+            return
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "index.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS audio_cache ("
+            "video_id TEXT PRIMARY KEY, plays INTEGER NOT NULL DEFAULT 0, last_used REAL NOT NULL, "
+            "size INTEGER, title TEXT, duration REAL, thumbnail TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_audio_cache_last_used ON audio_cache(last_used)")
+        self._db.commit()
+        self._reconcile()
+
+    def _file(self, video_id):
+        return os.path.join(self.path, f"{video_id}.opus")
+
+    def _reconcile(self):
+        # Halbfertige Dateien eines Abbruchs löschen, Index-Einträge ohne Datei zurücksetzen.
+        # Nur alte .part-Dateien – andere Worker-Prozesse können gerade selbst schreiben.
+        for name in os.listdir(self.path):
+            part = os.path.join(self.path, name)
+            if name.endswith(".part") and time.time() - os.path.getmtime(part) > 3600:
+                os.remove(part)
+        rows = self._db.execute("SELECT video_id FROM audio_cache WHERE size IS NOT NULL").fetchall()
+        missing = [(video_id,) for video_id, in rows if not os.path.exists(self._file(video_id))]
+        self._db.executemany("UPDATE audio_cache SET size = NULL WHERE video_id = ?", missing)
+        self._db.commit()
+
+    def lookup(self, video_id):
+        """Gibt ein info-Dict für die lokale Datei zurück oder None, wenn nichts im Cache liegt."""
+        if not self.enabled or not video_id:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT title, duration, thumbnail FROM audio_cache WHERE video_id = ? AND size IS NOT NULL",
+                (video_id,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            path = self._file(video_id)
+            if not os.path.exists(path):
+                self._db.execute("UPDATE audio_cache SET size = NULL WHERE video_id = ?", (video_id,))
+                self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE audio_cache SET last_used = ? WHERE video_id = ?", (time.time(), video_id))
+            self._db.commit()
+            self.hits += 1
+        title, duration, thumbnail = row
+        return {
+            'id': video_id,
+            'url': path,
+            'cached_path': path,
+            'acodec': 'opus',
+            'title': title,
+            'duration': duration,
+            'thumbnail': thumbnail
+        }
+
+    def record_play(self, info):
+        """
+        Zählt eine Wiedergabe und startet bei Erreichen von `min_plays` das Befüllen. Läuft bei
+        jedem Trackstart auf dem Event-Loop – SQLite und Dateizugriffe daher im Worker-Thread.
+        """
+        video_id = info.get('id')
+        if not self.enabled or not video_id or info.get('cached_path'):
+            return
+        asyncio.create_task(self._record_play(video_id, info))
+
+    async def _record_play(self, video_id, info):
+        try:
+            plays, size = await asyncio.to_thread(self._count_play, video_id)
+        except Exception as e:
+            logging.error(f"Error recording audio cache play for {video_id}: {e}")
+            return
+        if size is not None or plays < self.min_plays or video_id in self._filling:
+            return
+        if not info.get('duration') or info['duration'] > self.max_duration:
+            # Livestreams und sehr lange Videos nicht cachen
+            return
+        self._filling.add(video_id)
+        await self._fill(video_id, info)
+
+    def _count_play(self, video_id):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO audio_cache (video_id, plays, last_used) VALUES (?, 1, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET plays = plays + 1, last_used = excluded.last_used",
+                (video_id, time.time())
+            )
+            self._db.commit()
+            return self._db.execute(
+                "SELECT plays, size FROM audio_cache WHERE video_id = ?", (video_id,)
+            ).fetchone()
+
+    async def _fill(self, video_id, info):
+        path = self._file(video_id)
+        part = f"{path}.{os.getpid()}.part"
+        # YouTube liefert meist schon Opus (webm) – dann nur umpacken statt neu kodieren
+        if info.get('acodec') == 'opus':
+            codec = ['-c:a', 'copy']
+        else:
+            codec = ['-c:a', 'libopus', '-b:a', f"{self.bitrate}k", '-ar', '48000', '-ac', '2']
+        try:
+            async with self._fill_semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    config['ffmpeg_path'], '-nostdin', '-loglevel', 'error', '-y',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', info['url'], '-vn', *codec, '-f', 'opus', part,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await process.communicate()
+            if process.returncode != 0:
+                logging.error(f"Error caching audio for {video_id}: {stderr.decode(errors='replace').strip()}")
+                return
+            await asyncio.to_thread(self._store, video_id, info, part)
+            print(f"DEBUG: Im Audio-Cache gespeichert: {info.get('title')}")
+        except Exception as e:
+            logging.error(f"Error caching audio for {video_id}: {e}")
+        finally:
+            self._filling.discard(video_id)
+            await asyncio.to_thread(self._remove_part, part)
+
+    def _store(self, video_id, info, part):
+        path = self._file(video_id)
+        os.replace(part, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._db.execute(
+                "UPDATE audio_cache SET size = ?, title = ?, duration = ?, thumbnail = ? WHERE video_id = ?",
+                (size, info.get('title'), info.get('duration'), info.get('thumbnail'), video_id)
+            )
+            self._db.commit()
+            self._evict()
+
+    @staticmethod
+    def _remove_part(part):
+        if os.path.exists(part):
+            os.remove(part)
+
+    def _evict(self):
+        # LRU: am längsten nicht gespielte Dateien löschen, bis die Größenbegrenzung passt
+        rows = self._db.execute(
+            "SELECT video_id, size FROM audio_cache WHERE size IS NOT NULL ORDER BY last_used DESC"
+        ).fetchall()
+        total = 0
+        evicted = []
+        for video_id, size in rows:
+            total += size
+            if total > self.max_size:
+                evicted.append((video_id,))
+        for video_id, in evicted:
+            try:
+                os.remove(self._file(video_id))
+            except FileNotFoundError:
+                pass
+        self._db.executemany("UPDATE audio_cache SET size = NULL WHERE video_id = ?", evicted)
+        self._db.commit()
+
+    def stats(self):
+        if not self.enabled:
+            return None
+        with self._lock:
+            files, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio_cache WHERE size IS NOT NULL"
+            ).fetchone()
+        return {'files': files, 'size_mb': round(size / (1024 * 1024)), 'hits': self.hits}
+
+
+audio_cache_settings = config.get('audio_cache', {})
+audio_cache = AudioCache(
+    os.path.join(BASE_DIR, audio_cache_settings.get('path', os.path.join(DATA_DIR, "audio_cache"))),
+    enabled=audio_cache_settings.get('enabled', False),
+    max_size=audio_cache_settings.get('max_size_mb', 2048) * 1024 * 1024,
+    min_plays=audio_cache_settings.get('min_plays', 2),
+    max_duration=audio_cache_settings.get('max_duration', 900),
+    bitrate=audio_cache_settings.get('bitrate', 128),
+    fill_concurrency=audio_cache_settings.get('fill_concurrency', 1)
+)
+
+##############################################
+# 4f. Queue-Journal (Absturzsicherheit & Fortsetzen)
+##############################################
+class QueueJournal:
+    """
+    Append-only-Journal pro Server (data/queues/<guild_id>.jsonl) mit allen Änderungen an Queue,
+    Verlauf, aktuellem Song und Wiedergabeposition. Einträge werden gesammelt und nach
+    `flush_delay` Sekunden im Worker-Thread angehängt und mit fsync gesichert. Nach
+    `compact_after` Einträgen ersetzt ein Snapshot des aktuellen Zustands die Datei.
+    """
+
+    def __init__(self, path, enabled=True, flush_delay=1.0, compact_after=1000, position_interval=15):
+        self.path = path
+        self.enabled = enabled
+        self.flush_delay = flush_delay
+        self.compact_after = compact_after
+        self.position_interval = position_interval
+        self._pending = {}               # guild_id -> [Zeilen]
+        self._replace = set()            # Server, deren Datei beim nächsten Flush ersetzt wird
+        self._counts = {}                # Journal-Einträge seit dem letzten Snapshot
+        self._states = {}                # letzter 'state'-Eintrag je Server (für Snapshots)
+        self._flush_handle = None
+        self._lock = threading.Lock()
+        # Hält einen Flush über das gesamte Schreiben, damit Stapel in Aufnahme-Reihenfolge auf der
+        # Platte landen – auch wenn ein fsync länger dauert als flush_delay
+        self._write_lock = threading.Lock()
+        if enabled:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, guild_id):
+        return os.path.join(self.path, f"{guild_id}.jsonl")
+
+    def record(self, player, op, **data):
+        if not self.enabled:
+            return
+        guild_id = player.guild_id
+        if op == 'state':
+            self._states[guild_id] = data
+        count = self._counts.get(guild_id, 0) + 1
+        if count > self.compact_after:
+            self.snapshot(player)
+            return
+        self._counts[guild_id] = count
+        line = json.dumps({'op': op, **data}, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._pending.setdefault(guild_id, []).append(line)
+        self._schedule()
+
+    def snapshot(self, player):
+        """Ersetzt das Journal eines Servers beim nächsten Flush durch seinen aktuellen Zustand."""
+        if not self.enabled:
+            return
+        guild_id = player.guild_id
+        line = json.dumps({
+            'op': 'snapshot',
+            'queue': [entry.to_dict() for entry in player.song_queue],
+            'history': [entry.to_dict() for entry in player.played_songs],
+            'current': player.current.to_dict() if player.current else None,
+            'state': self._states.get(guild_id, {})
+        }, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._pending[guild_id] = [line]
+            self._replace.add(guild_id)
+        self._counts[guild_id] = 0
+        self._schedule()
+
+    def _schedule(self):
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        asyncio.create_task(asyncio.to_thread(self.flush))
+
+    def flush(self):
+        with self._write_lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            replace, self._replace = self._replace, set()
+        for guild_id, lines in pending.items():
+            path = self._file(guild_id)
+            data = "\n".join(lines) + "\n"
+            try:
+                if guild_id in replace:
+                    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(path + ".tmp", path)
+                else:
+                    with open(path, 'a', encoding='utf-8') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+            except OSError as e:
+                logging.error(f"Error writing queue journal for guild {guild_id}: {e}")
+
+    def load(self, guild_id):
+        """Spielt das Journal eines Servers ab und gibt (queue, history, current, state) zurück."""
+        queue, history, current, state = deque(), deque(), None, {}
+        try:
+            with open(self._file(guild_id), 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        for line in lines:
+            try:
+                op = json.loads(line)
+            except ValueError:
+                # Bei einem Absturz halb geschriebene letzte Zeile
+                continue
+            kind = op['op']
+            if kind == 'snapshot':
+                queue = deque(QueueEntry.from_dict(data) for data in op['queue'])
+                history = deque(QueueEntry.from_dict(data) for data in op['history'])
+                current = QueueEntry.from_dict(op['current']) if op['current'] else None
+                state = dict(op['state'])
+            elif kind == 'add':
+                queue.extend(QueueEntry.from_dict(data) for data in op['entries'])
+            elif kind == 'insert':
+                for offset, data in enumerate(op['entries']):
+                    queue.insert(op['index'] + offset, QueueEntry.from_dict(data))
+            elif kind == 'pop' and queue:
+                queue.popleft()
+            elif kind == 'push_front':
+                queue.appendleft(QueueEntry.from_dict(op['entry']))
+            elif kind == 'current':
+                if op['remember'] and current is not None:
+                    history.append(current)
+                current = QueueEntry.from_dict(op['entry']) if op['entry'] else None
+            elif kind == 'history_pop' and history:
+                history.pop()
+            elif kind == 'clear':
+                queue.clear()
+                history.clear()
+                current = None
+            elif kind == 'state':
+                state = {key: value for key, value in op.items() if key != 'op'}
+        return queue, history, current, state
+
+    def guild_ids(self):
+        if not self.enabled:
+            return []
+        return [int(name[:-6]) for name in os.listdir(self.path) if name.endswith(".jsonl") and name[:-6].isdigit()]
+
+    async def track_positions(self):
+        """Schreibt regelmäßig die Position laufender Songs, damit ein Neustart dort fortsetzt."""
+        while True:
+            await asyncio.sleep(self.position_interval)
+            for player in list(players.values()):
+                voice_client = player.voice_client
+                if voice_client and voice_client.is_playing() and player.current is not None:
+                    player.record_state(voice_client.channel.id)
+
+
+queue_journal_settings = config.get('queue_journal', {})
+queue_journal = QueueJournal(
+    os.path.join(BASE_DIR, queue_journal_settings.get('path', os.path.join(DATA_DIR, "queues"))),
+    enabled=queue_journal_settings.get('enabled', True),
+    flush_delay=queue_journal_settings.get('flush_delay', 1),
+    compact_after=queue_journal_settings.get('compact_after', 1000),
+    position_interval=queue_journal_settings.get('position_interval', 15)
+)
+queues_resumed = False
+
+
+async def resume_queues():
+    """Stellt nach einem Neustart Queues aus dem Journal wieder her und spielt an der alten Stelle weiter."""
+    for guild_id in await asyncio.to_thread(queue_journal.guild_ids):
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            # Server gehört zu einem anderen Shard bzw. Worker-Prozess
+            continue
+        try:
+            restored = await asyncio.to_thread(queue_journal.load, guild_id)
+            if restored is None:
+                continue
+            queue, history, current, state = restored
+            channel = guild.get_channel(state.get('voice_channel_id') or 0)
+            if channel is None or (current is None and not queue):
+                continue
+            player = get_player(guild)
+            player.song_queue, player.played_songs, player.current = queue, history, current
+            player.text_channel_id = state.get('text_channel_id')
+            queue_journal.snapshot(player)
+            voice_client = guild.voice_client or await channel.connect()
+            print(f"DEBUG: Queue von {guild.name} wiederhergestellt ({len(queue)} Einträge)")
+            if current is None:
+                await play_next_song(voice_client)
+                continue
+            # Bereits aufgelöste Einträge tragen ihre YouTube-URL im Journal – keine neue Suche nötig
+            info = await extraction_pool.run('playback', fetch_stream_info, current.source)
+            if info is None:
+                await play_next_song(voice_client)
+                continue
+            current.apply_info(info)
+            play_entry(player, voice_client, info, state.get('position') or 0)
+            player.schedule_lookahead()
+            player.schedule_prefetch()
+            await send_now_playing_embed(player)
+        except Exception as e:
+            logging.error(f"Error resuming queue for guild {guild_id}: {e}")
+
 ##############################################
 # 5. Discord Events & Befehle
 ##############################################
 @bot.event
 async def on_ready():
+    global queues_resumed
     print(f'Bot ist eingeloggt als {bot.user}')
     for guild in bot.guilds:
         await guild.me.edit(nick='T_MusicBot')
+    # on_ready kommt nach jedem Reconnect erneut – nur beim ersten Mal fortsetzen
+    if not queues_resumed:
+        queues_resumed = True
+        asyncio.create_task(asyncio.to_thread(warm_up))
+        await resume_queues()
 
 
 @bot.event
-async def on_raw_reaction_add(payload):
-    global now_playing_message
-    if payload.user_id == bot.user.id:
-        return
-    if now_playing_message is None or payload.message_id != now_playing_message.id:
-        return
-    guild = bot.get_guild(payload.guild_id)
-    if guild is None:
-        return
-    member = guild.get_member(payload.user_id)
-    if member is None:
-        return
-    emoji = str(payload.emoji)
-    voice_client = guild.voice_client
-    if emoji == "⏮️":
-        if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+async def setup_hook():
+    # Persistente Buttons auch für Jetzt-spielt-Nachrichten von vor einem Neustart registrieren
+    bot.add_view(PlayerControls())
+    await asyncio.to_thread(settings_store.load_all)
+    if queue_journal.enabled:
+        asyncio.create_task(queue_journal.track_positions())
+    if watchdog_settings.get('enabled', True):
+        loop_watchdog.start()
+    await start_metrics_server()
+
+
+class PlayerControls(discord.ui.View):
+    """
+    Persistente Buttons unter der Jetzt-spielt-Nachricht. Jede Aktion wird mit genau einer
+    Interaction-Antwort bestätigt – ohne fetch_message/remove_reaction pro Klick.
+    """
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    async def interaction_check(self, interaction):
+        lang = guild_lang(interaction.guild)
+        if interaction.guild is None or interaction.guild.voice_client is None:
+            await interaction.response.send_message(lang['no_song_playing'], ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.secondary, custom_id="t_musicbot:previous", row=0)
+    async def previous_button(self, interaction, button):
+        voice_client = interaction.guild.voice_client
+        # Das Laden des vorherigen Songs kann länger als 3 s dauern – sofort bestätigen
+        await interaction.response.defer()
+        if voice_client.is_playing() or voice_client.is_paused():
             await play_previous_song(voice_client)
-    elif emoji == "⏭️":
-        if voice_client and voice_client.is_playing():
-            voice_client.stop()
-    elif emoji == "⏯️":
-        if voice_client and voice_client.is_playing():
-            voice_client.pause()
-        elif voice_client and voice_client.is_paused():
-            voice_client.resume()
-    elif emoji == "⏹️":
-        if voice_client:
-            song_queue.clear()
-            voice_client.stop()
-            await voice_client.disconnect()
-            if now_playing_message:
-                try:
-                    await now_playing_message.delete()
-                except discord.errors.NotFound:
-                    pass
-                now_playing_message = None
-            await guild.text_channels[0].send(lang['playback_stopped_emoji'])
-    channel = bot.get_channel(payload.channel_id)
-    try:
-        message = await channel.fetch_message(payload.message_id)
-    except discord.errors.NotFound:
-        return
-    user = guild.get_member(payload.user_id)
-    await message.remove_reaction(payload.emoji, user)
+
+    @discord.ui.button(emoji="⏯️", style=discord.ButtonStyle.primary, custom_id="t_musicbot:pause", row=0)
+    async def pause_button(self, interaction, button):
+        lang = guild_lang(interaction.guild)
+        voice_client = interaction.guild.voice_client
+        player = get_player(interaction.guild)
+        if not player.pause() and not player.resume():
+            await interaction.response.send_message(lang['no_song_playing'], ephemeral=True)
+            return
+        paused = voice_client.is_paused()
+        player.progress_last_paused = paused
+        embed = interaction.message.embeds[0]
+        embed.title = "⏸️ Jetzt spielt 🎶" if paused else "Jetzt spielt 🎶"
+        await interaction.response.edit_message(embed=embed)
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary, custom_id="t_musicbot:skip", row=0)
+    async def skip_button(self, interaction, button):
+        lang = guild_lang(interaction.guild)
+        voice_client = interaction.guild.voice_client
+        if voice_client.is_playing() or voice_client.is_paused():
+            get_player(interaction.guild).stop_playback()
+            await interaction.response.send_message(lang['song_skipped_emoji'], ephemeral=True)
+        else:
+            await interaction.response.send_message(lang['no_song_playing'], ephemeral=True)
+
+    @discord.ui.button(emoji="⏹️", style=discord.ButtonStyle.danger, custom_id="t_musicbot:stop", row=0)
+    async def stop_button(self, interaction, button):
+        lang = guild_lang(interaction.guild)
+        voice_client = interaction.guild.voice_client
+        player = get_player(interaction.guild)
+        player.clear()
+        player.stop_progress()
+        player.forget_now_playing()
+        # Die Jetzt-spielt-Nachricht wird in derselben Antwort zur Stopp-Meldung
+        await interaction.response.edit_message(content=lang['playback_stopped_emoji'], embed=None, view=None)
+        voice_client.stop()
+        await voice_client.disconnect()
+
+    @discord.ui.button(emoji="🔁", style=discord.ButtonStyle.secondary, custom_id="t_musicbot:loop", row=1)
+    async def loop_button(self, interaction, button):
+        lang = guild_lang(interaction.guild)
+        player = get_player(interaction.guild)
+        player.is_looping = not player.is_looping
+        settings_store.set(player.guild_id, loop=player.is_looping)
+        message = lang['loop_enabled'] if player.is_looping else lang['loop_disabled']
+        await interaction.response.send_message(message, ephemeral=True)
+
+    @discord.ui.button(emoji="🔉", style=discord.ButtonStyle.secondary, custom_id="t_musicbot:volume_down", row=1)
+    async def volume_down_button(self, interaction, button):
+        lang = guild_lang(interaction.guild)
+        player = get_player(interaction.guild)
+        set_volume(player, player.volume - VOLUME_STEP)
+        await interaction.response.send_message(lang['volume_set'].format(volume=player.volume), ephemeral=True)
+
+    @discord.ui.button(emoji="🔊", style=discord.ButtonStyle.secondary, custom_id="t_musicbot:volume_up", row=1)
+    async def volume_up_button(self, interaction, button):
+        lang = guild_lang(interaction.guild)
+        player = get_player(interaction.guild)
+        set_volume(player, player.volume + VOLUME_STEP)
+        await interaction.response.send_message(lang['volume_set'].format(volume=player.volume), ephemeral=True)
 
 ##############################################
 # 6. Befehle
@@ -396,9 +2441,13 @@ play_name, play_aliases = get_command_info('play')
 
 @bot.command(name=play_name, aliases=play_aliases, help=lang['play_help'])
 async def play(ctx, *, url: str):
+    lang = guild_lang(ctx.guild)
     if not ctx.author.voice:
         await ctx.send(lang['no_voice_channel'])
         return
+    player = get_player(ctx.guild)
+    player.text_channel_id = ctx.channel.id
+    requester_id = ctx.author.id
     # Normalisiere Spotify-Links
     if "open.spotify.com" in url:
         url = normalize_spotify_url(url)
@@ -409,199 +2458,282 @@ async def play(ctx, *, url: str):
     if 'open.spotify.com/playlist' in url:
         tracks = await get_spotify_playlist_tracks(url)
         if tracks:
+            # Tracks werden erst kurz vor dem Abspielen auf YouTube gesucht
+            player.enqueue(
+                QueueEntry(query=query, title=query, duration=duration, requester_id=requester_id, spotify_id=spotify_id)
+                for query, spotify_id, duration in tracks
+            )
+            player.schedule_lookahead()
             await ctx.send(lang['playlist_added_spotify'].format(username=ctx.author.name))
-            for track in tracks:
-                youtube_url = await get_youtube_url(track)
-                if youtube_url:
-                    song_queue.append((ctx, youtube_url))
-                else:
-                    print(f"DEBUG: Kein YouTube-Ergebnis für: {track}")
+        else:
+            await ctx.send(lang['playback_error'])
+            return
+    # Spotify Album, Künstler-Top-Tracks oder Lieblingssongs (open.spotify.com/collection/tracks)
+    elif any(f'open.spotify.com/{kind}' in url for kind in ('album/', 'artist/', 'collection/tracks')):
+        tracks = await get_spotify_collection_tracks(url)
+        if tracks:
+            player.enqueue(
+                QueueEntry(query=query, title=query, duration=duration, requester_id=requester_id, spotify_id=spotify_id)
+                for query, spotify_id, duration in tracks
+            )
+            player.schedule_lookahead()
+            await ctx.send(lang['spotify_tracks_added'].format(username=ctx.author.name, count=len(tracks)))
         else:
             await ctx.send(lang['playback_error'])
             return
     # Spotify Track
     elif 'open.spotify.com/track' in url:
-        _, track_name, artist_name, _, _, _ = await get_spotify_track_info(url)
+        _, track_name, artist_name, album_art, duration, _ = await get_spotify_track_info(url)
         if not track_name or not artist_name:
             await ctx.send(lang['playback_error'])
             return
         query = f"{artist_name} - {track_name}"
-        youtube_url = await get_youtube_url(query)
+        spotify_id = extract_spotify_id(url, 'track')
+        youtube_url = await get_youtube_url(query, spotify_id, duration)
         if not youtube_url:
             await ctx.send(lang['playback_error'])
             return
-        song_queue.append((ctx, youtube_url))
+        player.enqueue([QueueEntry(
+            youtube_url, query=query, title=query, duration=duration, thumbnail=album_art,
+            requester_id=requester_id, spotify_id=spotify_id
+        )])
         await ctx.send(lang['song_added_to_queue'].format(username=ctx.author.name))
     # YouTube Playlist
     elif 'youtube.com/playlist' in url or ('list=' in url and 'watch?v=' in url):
-        urls = await get_youtube_playlist_urls(url)
-        if urls:
+        # Nur das erste Fenster laden – Wartezeit bis zum ersten Song unabhängig von der Playlist-Länge
+        cursor = YoutubePlaylistCursor(url, requester_id)
+        entries = await cursor.fetch(cursor.window)
+        if entries:
             await ctx.send(lang['playlist_added_youtube'].format(username=ctx.author.name))
-            for video_url in urls:
-                song_queue.append((ctx, video_url))
+            player.add_playlist_cursor(cursor, entries)
         else:
             await ctx.send(lang['playback_error'])
             return
     # Einzelner YouTube-Link oder Suchbegriff
     else:
         if 'youtube.com/watch' in url or 'youtu.be/' in url:
-            song_queue.append((ctx, url))
+            player.enqueue([QueueEntry(url, requester_id=requester_id)])
         else:
             youtube_url = await get_youtube_url(url)
             if youtube_url:
-                song_queue.append((ctx, youtube_url))
+                entry = QueueEntry(youtube_url, query=url, requester_id=requester_id)
+                metadata = get_metadata(youtube_url)
+                if metadata:
+                    entry.title, entry.duration = metadata
+                player.enqueue([entry])
             else:
                 await ctx.send(lang['playback_error'])
                 return
         await ctx.send(lang['song_added_to_queue'].format(username=ctx.author.name))
     if not ctx.voice_client.is_playing():
         await play_next_song(ctx.voice_client)
+    else:
+        player.schedule_prefetch()
+
+
+# "opus": FFmpeg liefert fertige Opus-Pakete, Lautstärke per FFmpeg-Filter (wenig CPU in Python).
+# "pcm": FFmpeg liefert PCM, Lautstärke per PCMVolumeTransformer, discord.py kodiert Opus selbst.
+playback_mode = config.get('playback_mode', 'opus')
+opus_bitrate = int(config.get('opus_bitrate', 128))
+
+
+def create_audio_source(info, volume, position=0):
+    before_options = []
+    if not info.get('cached_path'):
+        # Lokale Dateien aus dem Audio-Cache brauchen keine Reconnect-Optionen
+        before_options.append('-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5')
+    if position:
+        before_options.append(f'-ss {position:.2f}')
+    before_options = ' '.join(before_options) or None
+    if playback_mode == 'pcm':
+        return discord.PCMVolumeTransformer(
+            discord.FFmpegPCMAudio(info['url'], executable=config['ffmpeg_path'],
+                                   before_options=before_options, options='-vn'),
+            volume=volume / 100
+        )
+    if volume == 100 and info.get('acodec') == 'opus':
+        # Quelle ist bereits Opus und es gibt nichts zu regeln – nur umpacken, nicht neu kodieren
+        return discord.FFmpegOpusAudio(info['url'], codec='copy', executable=config['ffmpeg_path'],
+                                       before_options=before_options, options='-vn')
+    return discord.FFmpegOpusAudio(info['url'], bitrate=opus_bitrate, executable=config['ffmpeg_path'],
+                                   before_options=before_options,
+                                   options=f'-vn -filter:a volume={volume / 100:.2f}')
+
+
+def play_entry(player, voice_client, info, position=0):
+    source = create_audio_source(info, player.volume, position)
+    guild_id = player.guild_id
+    player.playback_id += 1
+    playback_id = player.playback_id
+    voice_client.play(
+        source,
+        after=lambda e: asyncio.run_coroutine_threadsafe(on_finished(guild_id, e, playback_id), bot.loop)
+    )
+    player.stream_info = info
+    player.volume_pending = False
+    player.stop_requested = False
+    player.start_clock(position)
+    channel = getattr(voice_client, 'channel', None)
+    player.record_state(channel.id if channel else None)
+    if not position:
+        player.stream_retried = False
+        audio_cache.record_play(info)
+
+
+async def recover_stream(player, voice_client):
+    """Startet den abgebrochenen Song mit frisch aufgelöster Stream-URL an derselben Stelle neu."""
+    position = player.position()
+    player.stream_retried = True
+    info = await extraction_pool.run('playback', fetch_stream_info, player.current.source, True)
+    if info is None or not voice_client.is_connected() or voice_client.is_playing():
+        return False
+    print(f"DEBUG: Stream neu aufgelöst bei {int(position)}s: {info.get('title')}")
+    play_entry(player, voice_client, info, position)
+    return True
 
 # Nächsten Song aus der Queue abspielen
 async def play_next_song(voice_client):
-    global now_playing_message, played_songs, current_song, current_title, current_thumbnail
-    if song_queue:
-        ctx, url = song_queue.popleft()
-        if current_song is not None:
-            played_songs.append((ctx, current_song))
-        current_song = url
-        def fetch_song_info(url):
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'noplaylist': True,
-                'verbose': True,
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '320'
-                }],
-            }
+    if voice_client is None:
+        return
+    player = get_player(voice_client.guild)
+    if player.song_loading or voice_client.is_playing():
+        # Ein anderer Aufruf (z. B. Playlist-Auflösung) startet bereits einen Song
+        return
+    info = None
+    entry = None
+    # Fenster wurde schneller geleert (z. B. durch Skips), als nachgeladen wurde
+    await player.wait_for_refill()
+    while player.song_queue:
+        entry = player.pop_next()
+        player.song_loading = True
+        # Noch wartende Vorab-Aufträge für diesen Eintrag (Prefetch, Lookahead-Suche) nicht hinter
+        # den Prefetches anderer Server anstehen lassen
+        extraction_pool.promote(entry)
+        try:
+            info = await player.take_prefetched(entry)
+            url = await resolve_entry(entry)
+        finally:
+            extraction_pool.release(entry)
+            player.song_loading = False
+        if url is not None:
+            break
+        entry = None
+    player.schedule_lookahead()
+    if entry is not None:
+        player.set_current(entry)
+        if info is None:
+            player.song_loading = True
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    print(f"DEBUG: yt-dlp ruft ab: {url}")
-                    return ydl.extract_info(url, download=False)
-            except Exception as e:
-                logging.error(f"yt-dlp Fehler: {e}")
-                return None
-        info = await asyncio.to_thread(fetch_song_info, url)
+                info = await extraction_pool.run('playback', fetch_stream_info, entry.source)
+            finally:
+                player.song_loading = False
         if info is None:
-            await ctx.send("❌ Fehler: yt-dlp konnte keine Song-Informationen abrufen!")
+            await player.send("❌ Fehler: yt-dlp konnte keine Song-Informationen abrufen!")
             print("DEBUG: Kein Song-Info erhalten. Mögliche Ursachen: ungültiger Link, DRM oder yt-dlp-Fehler.")
             return
-        current_thumbnail = info.get('thumbnail', '')
-        url2 = info['url']
-        current_title = info.get('title', 'Unbekannter Titel')
-        duration = info.get('duration', 0)
-        ffmpeg_options = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-            'options': '-vn'
-        }
+        entry.apply_info(info)
         try:
-            source = discord.PCMVolumeTransformer(
-                discord.FFmpegPCMAudio(url2, executable=config['ffmpeg_path'], **ffmpeg_options),
-                volume=volume / 100
-            )
-            voice_client.play(source, after=lambda e: asyncio.run_coroutine_threadsafe(on_finished(ctx), bot.loop))
+            play_entry(player, voice_client, info)
         except Exception as e:
-            await ctx.send("❌ Fehler: Konnte den Song nicht abspielen! Prüfe FFmpeg!")
+            await player.send("❌ Fehler: Konnte den Song nicht abspielen! Prüfe FFmpeg!")
             print(f"DEBUG: FFmpeg-Fehler: {e}")
             return
-        await send_now_playing_embed(ctx, current_title, duration, current_thumbnail)
+        player.schedule_prefetch()
+        await send_now_playing_embed(player)
     else:
-        if voice_client and voice_client.is_connected():
+        player.record_state(None)
+        if voice_client.is_connected():
             await voice_client.disconnect()
 
 # Vorherigen Song abspielen
 async def play_previous_song(voice_client):
-    global now_playing_message, played_songs, song_queue, current_song, current_title, current_thumbnail
-    if played_songs:
-        if current_song is not None:
-            song_queue.appendleft((None, current_song))
-        ctx, url = played_songs.pop()
-        current_song = url
-        def fetch_song_info():
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'noplaylist': True,
-                'quiet': True,
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '320'
-                }],
-            }
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    return ydl.extract_info(url, download=False)
-            except Exception as e:
-                logging.error(f"Error fetching song info: {e}")
-                return None
-        info = await asyncio.to_thread(fetch_song_info)
+    player = get_player(voice_client.guild)
+    lang = player.lang
+    if player.played_songs:
+        entry = player.pop_history()
+        if player.current is not None:
+            player.push_front(player.current)
+        player.set_current(entry, remember=False)
+        info = await extraction_pool.run('playback', fetch_stream_info, entry.source)
         if info is None:
-            await voice_client.guild.text_channels[0].send(lang['playback_error'])
+            await player.send(lang['playback_error'])
             return
-        current_thumbnail = info.get('thumbnail', '')
-        url2 = info['url']
-        current_title = info.get('title', 'Unbekannter Titel')
-        duration = info.get('duration', 0)
-        ffmpeg_options = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-            'options': '-vn'
-        }
-        source = discord.PCMVolumeTransformer(
-            discord.FFmpegPCMAudio(url2, executable=config['ffmpeg_path'], **ffmpeg_options),
-            volume=volume / 100
-        )
-        voice_client.stop()
-        voice_client.play(source, after=lambda e: asyncio.run_coroutine_threadsafe(on_finished(ctx), bot.loop))
-        await send_now_playing_embed(ctx, current_title, duration, current_thumbnail)
+        entry.apply_info(info)
+        player.stop_playback()
+        play_entry(player, voice_client, info)
+        player.schedule_prefetch()
+        await send_now_playing_embed(player)
     else:
-        await voice_client.guild.text_channels[0].send(lang['no_previous_song'])
+        await player.send(lang['no_previous_song'])
 
 # Wenn ein Song endet
-async def on_finished(ctx):
-    global is_looping, song_queue, current_song
-    if is_looping:
-        song_queue.appendleft((ctx, current_song))
-    if song_queue:
-        await play_next_song(ctx.voice_client)
+async def on_finished(guild_id, error=None, playback_id=None):
+    player = get_player(guild_id)
+    if playback_id is not None and playback_id != player.playback_id:
+        # Callback einer bereits ersetzten Wiedergabe (z. B. nach play_previous_song)
+        return
+    voice_client = player.voice_client
+    if (voice_client and voice_client.is_connected() and player.current is not None
+            and player.stream_failed(error)):
+        if error is not None:
+            logging.error(f"Stream error, refreshing URL: {error}")
+        if await recover_stream(player, voice_client):
+            return
+    if player.is_looping and player.current is not None:
+        player.push_front(player.current)
+        player.set_current(None, remember=False)
+    await player.wait_for_refill()
+    if player.song_queue:
+        await play_next_song(voice_client)
     else:
-        if ctx.voice_client and ctx.voice_client.is_connected():
-            await ctx.voice_client.disconnect()
+        player.record_state(None)
+        if voice_client and voice_client.is_connected():
+            await voice_client.disconnect()
 
 # Jetzt-spielt-Embed senden
-async def send_now_playing_embed(ctx, title, duration, thumbnail_url):
-    global now_playing_message, progress_start_time, progress_duration, progress_last_progress
+async def send_now_playing_embed(player):
+    entry = player.current
     embed = discord.Embed(
         title="Jetzt spielt 🎶",
-        description=f"[**{title}**]({current_song})",
+        description=f"[**{entry.title or 'Unbekannter Titel'}**]({entry.source})",
         color=discord.Color.from_rgb(30, 215, 96)
     )
-    embed.set_thumbnail(url=thumbnail_url)
+    embed.set_thumbnail(url=entry.thumbnail or '')
+    duration = entry.duration or 0
     total_minutes, total_seconds = divmod(int(duration), 60)
     embed.add_field(name="Dauer", value=f"{total_minutes}:{total_seconds:02d}", inline=True)
     embed.set_footer(text=config['embed_settings']['footer'])
-    if now_playing_message is not None:
+    previous_message = player.forget_now_playing()
+    if previous_message is not None:
         try:
-            await now_playing_message.delete()
+            await previous_message.delete()
         except discord.errors.NotFound:
             pass
-    now_playing_message = await ctx.send(embed=embed)
-    for emoji in ["⏮️", "⏭️", "⏯️", "⏹️"]:
-        await now_playing_message.add_reaction(emoji)
-    progress_start_time = time.time()
-    progress_duration = duration
-    progress_last_progress = -1
-    update_progress_loop.start(ctx)
+    view = PlayerControls()
+    player.now_playing_message = await player.send(embed=embed, view=view)
+    if player.now_playing_message is None:
+        return
+    player.now_playing_view = view
+    player.progress_duration = duration
+    progress_scheduler.track(player)
 
 ##############################################
 # 7. Zusätzliche Befehle
 ##############################################
+VOLUME_STEP = 10
+
+
+def set_volume(player, value):
+    player.volume = max(1, min(100, value))
+    settings_store.set(player.guild_id, volume=player.volume)
+    player.apply_volume()
+
+
 volume_name, volume_aliases = get_command_info('volume')
 
 @bot.command(name=volume_name, aliases=volume_aliases, help=lang['volume_help'])
 async def volume_cmd(ctx, value: int = None):
-    global volume
+    lang = guild_lang(ctx.guild)
     if value is None:
         await ctx.send(lang['volume_prompt'].format(prefix=config['command_prefix']))
         return
@@ -609,10 +2741,9 @@ async def volume_cmd(ctx, value: int = None):
         await ctx.send(lang['invalid_volume'])
         return
     if ctx.voice_client and ctx.voice_client.source:
-        volume = value
-        save_volume(volume)
-        ctx.voice_client.source.volume = volume / 100
-        await ctx.send(lang['volume_set'].format(volume=volume))
+        player = get_player(ctx.guild)
+        set_volume(player, value)
+        await ctx.send(lang['volume_set'].format(volume=player.volume))
     else:
         await ctx.send(lang['no_voice_client'])
 
@@ -620,97 +2751,250 @@ pause_name, pause_aliases = get_command_info('pause')
 
 @bot.command(name=pause_name, aliases=pause_aliases, help=lang['pause_help'])
 async def pause_cmd(ctx):
-    if ctx.voice_client and ctx.voice_client.is_playing():
-        ctx.voice_client.pause()
+    lang = guild_lang(ctx.guild)
+    if ctx.voice_client and get_player(ctx.guild).pause():
         await ctx.send(lang['song_paused'])
 
 resume_name, resume_aliases = get_command_info('resume')
 
 @bot.command(name=resume_name, aliases=resume_aliases, help=lang['resume_help'])
 async def resume_cmd(ctx):
-    if ctx.voice_client and ctx.voice_client.is_paused():
-        ctx.voice_client.resume()
+    lang = guild_lang(ctx.guild)
+    if ctx.voice_client and get_player(ctx.guild).resume():
         await ctx.send(lang['song_resumed'])
 
 skip_name, skip_aliases = get_command_info('skip')
 
 @bot.command(name=skip_name, aliases=skip_aliases, help=lang['skip_help'])
 async def skip_cmd(ctx):
+    lang = guild_lang(ctx.guild)
     if ctx.voice_client and ctx.voice_client.is_playing():
-        ctx.voice_client.stop()
+        get_player(ctx.guild).stop_playback()
         await ctx.send(lang['song_skipped'])
 
 stop_name, stop_aliases = get_command_info('stop')
 
 @bot.command(name=stop_name, aliases=stop_aliases, help=lang['stop_help'])
 async def stop_cmd(ctx):
-    global now_playing_message
+    lang = guild_lang(ctx.guild)
     if ctx.voice_client:
-        song_queue.clear()
-        played_songs.clear()
+        player = get_player(ctx.guild)
+        player.clear()
         ctx.voice_client.stop()
         if ctx.voice_client.is_connected():
             await ctx.voice_client.disconnect()
+        player.stop_progress()
         await ctx.send(lang['song_finished'])
-        if now_playing_message:
+        message = player.forget_now_playing()
+        if message:
             try:
-                await now_playing_message.delete()
+                await message.delete()
             except discord.errors.NotFound:
                 pass
-            now_playing_message = None
 
-queue_name, queue_aliases = get_command_info('queue')
+QUEUE_PAGE_SIZE = 10
 
-@bot.command(name=queue_name, aliases=queue_aliases, help=lang['queue_help'])
-async def queue_cmd(ctx):
-    print("DEBUG: Queue-Befehl wurde aufgerufen!")
-    if song_queue:
-        embed = discord.Embed(title="🎶 Warteschlange", color=discord.Color.purple())
-        queue_message = await ctx.send(embed=embed)
-        for idx, (ctx_item, url) in enumerate(song_queue):
-            print(f"DEBUG: Verarbeite Song {idx + 1}: {url}")
-            info = await get_song_info_async(url)
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds or 0), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+def build_queue_embed(player, page):
+    """
+    Baut eine Seite der Warteschlange nur aus bereits bekannten Metadaten.
+    Gibt (embed, seite, seiten, einträge_ohne_titel) zurück.
+    """
+    lang = player.lang
+    entries = list(player.song_queue)
+    pages = max(1, math.ceil(len(entries) / QUEUE_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    start = (page - 1) * QUEUE_PAGE_SIZE
+    embed = discord.Embed(title="🎶 Warteschlange", color=discord.Color.purple())
+    missing = []
+    for idx, entry in enumerate(entries[start:start + QUEUE_PAGE_SIZE], start=start + 1):
+        if entry.title is None and entry.resolved:
+            metadata = get_metadata(entry.source)
+            if metadata:
+                entry.title, entry.duration = metadata
+        name = f"{idx}. {entry.title[:200]}" if entry.title else f"{idx}."
+        if entry.title and entry.duration:
+            name += f" ({format_duration(entry.duration)})"
+        if not entry.resolved:
+            # Noch nicht aufgelöst – keine Suche nur für die Anzeige
+            embed.add_field(name=name, value="🔎", inline=False)
+            continue
+        if entry.title is None:
+            missing.append(entry)
+        embed.add_field(name=name, value=f"[Link]({entry.source})", inline=False)
+    embed.set_footer(text=lang['queue_page'].format(page=page, pages=pages, count=len(entries)))
+    return embed, page, pages, missing
+
+
+class QueueView(discord.ui.View):
+    """Blättert durch die Warteschlange, ohne Songs erneut zu extrahieren."""
+
+    def __init__(self, player, page):
+        super().__init__(timeout=180)
+        self.player = player
+        self.page = page
+        self.message = None
+        self.fill_task = None
+
+    def fill_missing(self, missing):
+        # Fehlende Titel der angezeigten Seite gesammelt nachladen und einmal neu zeichnen
+        if self.fill_task is not None and not self.fill_task.done():
+            self.fill_task.cancel()
+        if missing:
+            self.fill_task = asyncio.create_task(self._fill_missing(missing))
+
+    async def _fill_missing(self, missing):
+        async def fetch(entry):
+            # Gleichzeitigkeit begrenzt die Klasse 'metadata' des Extraktions-Pools
+            info = await get_song_info_async(entry.source)
             if info:
-                title = info.get('title', 'Unbekannter Titel')
-                duration = info.get('duration', 0)
-                minutes, seconds = divmod(duration, 60)
-                embed.add_field(name=f"{idx + 1}. {title} ({minutes}:{seconds:02d})", value=f"[Link]({url})", inline=False)
-            else:
-                embed.add_field(name=f"{idx + 1}.", value=f"[Link]({url})", inline=False)
+                entry.apply_info(info)
+
+        await asyncio.gather(*(fetch(entry) for entry in missing))
+        embed, self.page, _, _ = build_queue_embed(self.player, self.page)
+        try:
+            await self.message.edit(embed=embed, view=self)
+        except discord.errors.HTTPException as e:
+            logging.error(f"Error updating queue message: {e}")
+
+    async def show_page(self, interaction, page):
+        embed, self.page, _, missing = build_queue_embed(self.player, page)
+        await interaction.response.edit_message(embed=embed, view=self)
+        self.fill_missing(missing)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self.show_page(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        if self.fill_task is not None and not self.fill_task.done():
+            self.fill_task.cancel()
+        if self.message is not None:
             try:
-                await queue_message.edit(embed=embed)
-            except Exception as e:
-                logging.error(f"Error updating queue message: {e}")
-            await asyncio.sleep(0.5)
+                await self.message.edit(view=None)
+            except discord.errors.HTTPException:
+                pass
+
+
+queue_name, queue_aliases = get_command_info('queue')
+
+@bot.command(name=queue_name, aliases=queue_aliases, help=lang['queue_help'])
+async def queue_cmd(ctx, page: int = 1):
+    lang = guild_lang(ctx.guild)
+    player = get_player(ctx.guild)
+    if player.song_queue:
+        embed, page, pages, missing = build_queue_embed(player, page)
+        view = QueueView(player, page) if pages > 1 or missing else None
+        queue_message = await ctx.send(embed=embed, view=view)
+        if view is not None:
+            view.message = queue_message
+            view.fill_missing(missing)
     else:
-        print("DEBUG: Die Warteschlange ist leer.")
         await ctx.send(lang['queue_empty'])
 
 help_name, help_aliases = get_command_info('help')
 
 @bot.command(name=help_name, aliases=help_aliases, help=lang['help_help'])
 async def help_cmd(ctx):
+    lang = guild_lang(ctx.guild)
     embed = discord.Embed(title="Hilfe - Verfügbare Befehle", color=discord.Color.green())
     for command in bot.commands:
-        embed.add_field(name=f"{config['command_prefix']}{command.name}", value=command.help, inline=False)
+        # Hilfetexte in der Sprache des Servers, Schlüssel nach Funktionsname (z. B. volume_cmd -> volume_help)
+        key = command.callback.__name__
+        key = (key[:-4] if key.endswith('_cmd') else key) + '_help'
+        embed.add_field(name=f"{config['command_prefix']}{command.name}", value=lang.get(key, command.help), inline=False)
     await ctx.send(embed=embed)
 
 loop_name, loop_aliases = get_command_info('loop')
 
 @bot.command(name=loop_name, aliases=loop_aliases, help=lang['loop_help'])
 async def loop_cmd(ctx):
-    global is_looping
-    is_looping = not is_looping
-    if is_looping:
+    lang = guild_lang(ctx.guild)
+    player = get_player(ctx.guild)
+    player.is_looping = not player.is_looping
+    settings_store.set(player.guild_id, loop=player.is_looping)
+    if player.is_looping:
         await ctx.send(lang['loop_enabled'])
     else:
         await ctx.send(lang['loop_disabled'])
 
+setlang_name, setlang_aliases = get_command_info('setlang')
+
+@bot.command(name=setlang_name, aliases=setlang_aliases, help=lang['setlang_help'])
+@commands.guild_only()
+@commands.has_guild_permissions(manage_guild=True)
+async def setlang_cmd(ctx, language_code: str):
+    language_code = language_code.lower()
+    if language_code not in languages:
+        await ctx.send(guild_lang(ctx.guild)['invalid_language'].format(languages=", ".join(sorted(languages))))
+        return
+    player = get_player(ctx.guild)
+    player.language = language_code
+    settings_store.set(ctx.guild.id, language=language_code)
+    await ctx.send(player.lang['language_set'].format(language=language_code))
+
+cache_name, cache_aliases = get_command_info('cache')
+
+@bot.command(name=cache_name, aliases=cache_aliases, help=lang['cache_help'])
+@commands.is_owner()
+async def cache_cmd(ctx, action: str = "stats", path: str = None):
+    # !cache stats | !cache export [Datei] | !cache import [Datei]
+    lang = guild_lang(ctx.guild)
+    path = os.path.join(BASE_DIR, path or os.path.join(DATA_DIR, "search_cache_export.json"))
+    if action == "export":
+        count = await asyncio.to_thread(search_cache.export_json, path)
+        await ctx.send(lang['cache_exported'].format(count=count, path=path))
+    elif action == "import":
+        try:
+            count = await asyncio.to_thread(search_cache.import_json, path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Error importing search cache from {path}: {e}")
+            await ctx.send(lang['command_error'])
+            return
+        await ctx.send(lang['cache_imported'].format(count=count, path=path))
+    else:
+        stats = await asyncio.to_thread(search_cache.stats)
+        message = lang['cache_stats'].format(**stats)
+        audio_stats = await asyncio.to_thread(audio_cache.stats)
+        if audio_stats is not None:
+            message += "\n" + lang['audio_cache_stats'].format(**audio_stats)
+        await ctx.send(message)
+
+profile_name, profile_aliases = get_command_info('profile')
+
+@bot.command(name=profile_name, aliases=profile_aliases, help=lang['profile_help'])
+@commands.is_owner()
+async def profile_cmd(ctx, seconds: int = 10):
+    # !profile [Sekunden] – Stichproben laufen in einem Thread, der Event-Loop bleibt frei
+    lang = guild_lang(ctx.guild)
+    seconds = max(1, min(60, seconds))
+    await ctx.send(lang['profile_started'].format(seconds=seconds))
+    samples, hottest = await asyncio.to_thread(sample_profile, seconds)
+    lines = [f"{self_share:5.1f}% {inclusive_share:5.1f}%  {location}"[:120]
+             for self_share, inclusive_share, location in hottest]
+    report = "\n".join(["  self   inkl.  Ort"] + lines)
+    await ctx.send(
+        lang['profile_result'].format(
+            seconds=seconds, samples=samples, stalls=loop_watchdog.stalls,
+            max_lag=round(loop_watchdog.max_lag * 1000)
+        ) + f"\n```\n{report[:1700]}\n```"
+    )
+
 ##############################################
 # 8. Fehlerbehandlung für Befehle
 ##############################################
 @bot.event
 async def on_command_error(ctx, error):
+    lang = guild_lang(ctx.guild)
     if isinstance(error, commands.CommandNotFound):
         await ctx.send(lang['command_not_found'])
     elif isinstance(error, commands.MissingRequiredArgument):
@@ -724,4 +3008,119 @@ async def on_command_error(ctx, error):
 ##############################################
 # 9. Bot starten
 ##############################################
-bot.run(config['bot_token'])
\ No newline at end of file
+async def fetch_recommended_shard_count():
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(config['bot_token'])
+        shard_count, _, _ = await http.get_bot_gateway()
+        return shard_count
+    finally:
+        await http.close()
+
+
+def plan_shards(shard_count, processes):
+    """Teilt die Shard-IDs in zusammenhängende Blöcke, einen pro Worker-Prozess."""
+    processes = max(1, min(processes, shard_count))
+    size, rest = divmod(shard_count, processes)
+    plan = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < rest else 0)
+        plan.append(list(range(start, end)))
+        start = end
+    return plan
+
+
+# Exit-Code eines Workers, den ein Neustart nicht behebt (ungültiges Token, fehlende Intents)
+WORKER_FATAL_EXIT = 3
+
+
+def run_coordinator():
+    """
+    Startet einen Worker-Prozess pro Shard-Block und startet abgestürzte Worker mit wachsender
+    Wartezeit neu. Die Worker werden nacheinander gestartet, damit ihre IDENTIFYs das Limit von
+    Discord nicht gemeinsam überschreiten.
+    """
+    shard_count = sharding.get('shard_count') or asyncio.run(fetch_recommended_shard_count())
+    plan = plan_shards(shard_count, sharding.get('processes', 1))
+    identify_delay = sharding.get('identify_delay', 5)
+    print(f"Koordinator: {shard_count} Shards auf {len(plan)} Prozesse verteilt: {plan}")
+
+    def start_worker(index):
+        started[index] = time.monotonic()
+        env = dict(os.environ)
+        env["T_MUSICBOT_WORKER"] = str(index)
+        env["T_MUSICBOT_SHARD_IDS"] = ",".join(map(str, plan[index]))
+        env["T_MUSICBOT_SHARD_COUNT"] = str(shard_count)
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    workers = {}
+    started = {}
+    backoff = {}
+    restart_at = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(len(plan)):
+        workers[index] = start_worker(index)
+        if index < len(plan) - 1:
+            time.sleep(identify_delay * len(plan[index]))
+    while not stopping:
+        time.sleep(1)
+        for index, process in list(workers.items()):
+            if process is None:
+                if time.monotonic() >= restart_at[index]:
+                    workers[index] = start_worker(index)
+                continue
+            code = process.poll()
+            if code is None:
+                continue
+            if code == WORKER_FATAL_EXIT:
+                # Login abgelehnt – mit demselben Token und denselben Intents scheitert jeder Neustart
+                logging.error(f"Worker {index} (shards {plan[index]}) cannot log in, not restarting")
+                del workers[index]
+                continue
+            if code == 0:
+                # Sauber beendet – nicht neu starten
+                del workers[index]
+                continue
+            if time.monotonic() - started[index] > 300:
+                # Lief eine Weile stabil – Wartezeit wieder von vorn
+                backoff.pop(index, None)
+            backoff[index] = min(backoff.get(index, 2.5) * 2, 60)
+            restart_at[index] = time.monotonic() + backoff[index]
+            workers[index] = None
+            logging.error(f"Worker {index} (shards {plan[index]}) exited with {code}, restarting in {backoff[index]}s")
+        if not workers:
+            break
+    for process in workers.values():
+        if process is not None and process.poll() is None:
+            process.terminate()
+    for process in workers.values():
+        if process is not None:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    if sharding.get('enabled', False) and sharding.get('processes', 1) > 1 and not worker_shard_ids:
+        run_coordinator()
+    else:
+        try:
+            bot.run(config['bot_token'])
+        except (discord.LoginFailure, discord.PrivilegedIntentsRequired) as e:
+            logging.error(f"Login failed: {e}")
+            print(f"Login fehlgeschlagen: {e}")
+            sys.exit(WORKER_FATAL_EXIT)
+        finally:
+            # Noch nicht geschriebene Einstellungen und Journal-Einträge beim Beenden sichern
+            settings_store.flush()
+            queue_journal.flush()
+            extraction_pool.shutdown()
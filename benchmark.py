@@ -0,0 +1,411 @@
+"""
+Offline-Benchmark für T_MusicBot.
+
+Ersetzt spotipy.Spotify und yt_dlp.YoutubeDL durch lokale Stand-ins mit einstellbarer Latenz
+und misst die Auflösungs- und Wiedergabepfade des Bots, ohne Discord, Spotify oder YouTube
+zu kontaktieren. FFmpeg wird nicht gestartet: "erstes Audio" ist der Moment, in dem der Bot
+die Audioquelle an voice_client.play übergibt.
+
+Beispiel:
+    python benchmark.py --tracks 500 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+##############################################
+# Stand-ins für Spotify und yt-dlp
+##############################################
+class StubSpotify:
+    """Liefert eine synthetische Playlist mit `tracks` Einträgen, seitenweise wie die Web-API."""
+
+    def __init__(self, tracks, latency):
+        self.tracks = tracks
+        self.latency = latency
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def _track(self, index):
+        return {
+            'id': f"sp{index:018d}",
+            'name': f"Benchmark Song {index}",
+            'artists': [{'name': f"Artist {index % 97}"}],
+            'album': {'images': [{'url': f"https://i.scdn.co/image/{index}"}]},
+            'duration_ms': 180000 + index % 60 * 1000,
+            'preview_url': None
+        }
+
+    def _page(self, playlist_id, offset, limit):
+        items = [{'track': self._track(i)} for i in range(offset, min(offset + limit, self.tracks))]
+        following = offset + limit
+        return {
+            'items': items,
+            'offset': offset,
+            'limit': limit,
+            'total': self.tracks,
+            'next': (f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks?offset={following}&limit={limit}"
+                     if following < self.tracks else None)
+        }
+
+    def playlist(self, playlist_id, fields=None, **kwargs):
+        self._wait()
+        return {'snapshot_id': f"snapshot-{self.tracks}", 'tracks': {'total': self.tracks}}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, **kwargs):
+        self._wait()
+        return self._page(playlist_id, offset, limit)
+
+    def next(self, result):
+        self._wait()
+        if not result.get('next'):
+            return None
+        playlist_id = result['next'].split("playlists/")[1].split("/")[0]
+        return self._page(playlist_id, result['offset'] + result['limit'], result['limit'])
+
+    def track(self, track_id, **kwargs):
+        self._wait()
+        return self._track(int(track_id.lstrip("sp") or 0))
+
+
+class StubYoutubeDL:
+    """Beantwortet ytsearch-Anfragen und Stream-Abfragen deterministisch nach `latency`-Sekunden."""
+
+    search_latency = 0.0
+    stream_latency = 0.0
+    playlist_size = 0
+    calls = 0
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def _playlist_entries(self):
+        # YouTube liefert Playlists in Seiten zu 100 Einträgen; jede Seite kostet eine Anfrage
+        for index in range(self.playlist_size):
+            if index % 100 == 0:
+                type(self).calls += 1
+                time.sleep(self.search_latency)
+            yield {'_type': 'url', 'id': f"pl{index:09d}", 'title': f"Playlist Video {index}", 'duration': 200}
+
+    def extract_info(self, url, download=False, **kwargs):
+        if "youtube.com/playlist" in url:
+            return {'_type': 'playlist', 'entries': self._playlist_entries()}
+        type(self).calls += 1
+        if url.startswith("ytsearch"):
+            time.sleep(self.search_latency)
+            count, query = url[len("ytsearch"):].split(":", 1)
+            return {'entries': [
+                {
+                    'id': f"{abs(hash((query, n))) % 10 ** 11:011d}",
+                    'title': query if n == 0 else f"{query} (Live)",
+                    'duration': 180,
+                    'channel': "Benchmark - Topic"
+                }
+                for n in range(int(count or 1))
+            ]}
+        time.sleep(self.stream_latency)
+        video_id = url.split("watch?v=")[-1].split("&")[0]
+        return {
+            'id': video_id,
+            'url': f"https://stub.googlevideo.com/videoplayback?id={video_id}&expire={int(time.time()) + 21600}",
+            'title': f"Video {video_id}",
+            'duration': 180,
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'acodec': 'opus'
+        }
+
+
+##############################################
+# Discord-Stand-ins (nur was die Befehle benutzen)
+##############################################
+class FakeVoiceClient:
+    def __init__(self, guild):
+        self.guild = guild
+        self.channel = None
+        self.source = None
+        self.playing = False
+        self.play_times = []
+
+    def play(self, source, after=None):
+        self.source = source
+        self.playing = True
+        self.play_times.append(time.perf_counter())
+
+    def is_playing(self):
+        return self.playing
+
+    def is_paused(self):
+        return False
+
+    def is_connected(self):
+        return True
+
+    def stop(self):
+        self.playing = False
+
+    async def disconnect(self):
+        self.playing = False
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.guild = guild
+        self.name = "Benchmark"
+        self.members = []
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self.guild)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+        self.text_channels = []
+
+
+class FakeContext:
+    def __init__(self, guild):
+        self.guild = guild
+        self.channel = type('Channel', (), {'id': 1})()
+        voice = type('Voice', (), {'channel': FakeVoiceChannel(guild)})()
+        self.author = type('Author', (), {'id': 2, 'name': "benchmark", 'voice': voice})()
+        self.send_times = []
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        self.send_times.append(time.perf_counter())
+        return None
+
+
+##############################################
+# Messungen
+##############################################
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(values):
+    return {
+        'median_ms': round(statistics.median(values) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'max_ms': round(max(values) * 1000, 3)
+    }
+
+
+def load_bot(settings, data_dir):
+    """Importiert T_MusicBot mit einer Benchmark-Konfiguration und den Stand-ins."""
+    config = {
+        "bot_token": "benchmark",
+        "spotify_client_id": "benchmark",
+        "spotify_client_secret": "benchmark",
+        "command_prefix": "!",
+        "language": "en",
+        "default_volume": 50,
+        "ffmpeg_path": "ffmpeg",
+        "search_cache": {"path": os.path.join(data_dir, "search_cache.db")},
+        "settings_store": {"path": os.path.join(data_dir, "settings.db")},
+        "queue_journal": {"path": os.path.join(data_dir, "queues")},
+        "audio_cache": {"enabled": False},
+        "embed_settings": {"footer": "Benchmark"}
+    }
+    config_path = os.path.join(data_dir, "config.json")
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    os.environ["T_MUSICBOT_CONFIG"] = config_path
+
+    import yt_dlp
+    StubYoutubeDL.search_latency = settings.search_latency
+    StubYoutubeDL.stream_latency = settings.stream_latency
+    StubYoutubeDL.playlist_size = settings.youtube_playlist_size
+    yt_dlp.YoutubeDL = StubYoutubeDL
+
+    sys.path.insert(0, BASE_DIR)
+    bot_module = importlib.import_module("T_MusicBot")
+    bot_module.sp = StubSpotify(settings.tracks, settings.spotify_latency)
+    bot_module.create_audio_source = lambda info, volume, position=0: object()
+    return bot_module
+
+
+def install_guild(bot_module, guild):
+    bot_module.bot.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+    bot_module.bot.get_channel = lambda channel_id: None
+
+
+async def measure_search_play(bot_module, guild_id):
+    guild = FakeGuild(guild_id)
+    install_guild(bot_module, guild)
+    ctx = FakeContext(guild)
+    start = time.perf_counter()
+    await bot_module.play.callback(ctx, url=f"benchmark search {guild_id}")
+    return guild.voice_client.play_times[0] - start
+
+
+async def measure_playlist(bot_module, guild_id, settings):
+    guild = FakeGuild(guild_id)
+    install_guild(bot_module, guild)
+    ctx = FakeContext(guild)
+    start = time.perf_counter()
+    await bot_module.play.callback(ctx, url="https://open.spotify.com/playlist/benchmark")
+    # Die Bestätigung "Playlist hinzugefügt" kommt, sobald alle Einträge in der Queue stehen
+    enqueue = ctx.send_times[0] - start
+    first_audio = guild.voice_client.play_times[0] - start
+    player = bot_module.get_player(guild_id)
+    queued = len(player.song_queue) + 1
+
+    # Songwechsel: laufenden Song "spielen" lassen, dann wie per Skip beenden
+    gaps = []
+    for _ in range(settings.track_changes):
+        await asyncio.sleep(settings.song_seconds)
+        voice_client = guild.voice_client
+        player.stop_playback()
+        before = len(voice_client.play_times)
+        start = time.perf_counter()
+        await bot_module.on_finished(guild_id, None, player.playback_id)
+        if len(voice_client.play_times) > before:
+            gaps.append(voice_client.play_times[-1] - start)
+    return player, enqueue, first_audio, queued, gaps
+
+
+async def measure_youtube_playlist(bot_module, guild_id):
+    guild = FakeGuild(guild_id)
+    install_guild(bot_module, guild)
+    ctx = FakeContext(guild)
+    start = time.perf_counter()
+    await bot_module.play.callback(ctx, url="https://www.youtube.com/playlist?list=PLbenchmark")
+    first_audio = guild.voice_client.play_times[0] - start
+    player = bot_module.get_player(guild_id)
+    queued = len(player.song_queue) + 1
+    player.clear()
+    return first_audio, queued
+
+
+def measure_queue_render(bot_module, player, repeats):
+    pages = max(1, -(-len(player.song_queue) // bot_module.QUEUE_PAGE_SIZE))
+    timings = []
+    for n in range(repeats):
+        page = (1, pages // 2 or 1, pages)[n % 3]
+        start = time.perf_counter()
+        bot_module.build_queue_embed(player, page)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def measure_entry_memory(bot_module):
+    # Speicher der Queue so, wie play() sie aus einer Spotify-Playlist aufbaut, inkl. Strings
+    previous_latency = bot_module.sp.latency
+    bot_module.sp.latency = 0
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    fetched = await bot_module.get_spotify_playlist_tracks("https://open.spotify.com/playlist/memory")
+    queue = deque(
+        bot_module.QueueEntry(query=query, title=query, duration=duration, requester_id=2, spotify_id=spotify_id)
+        for query, spotify_id, duration in fetched
+    )
+    del fetched
+    # Abgeschlossene gather-Futures hängen bis zur nächsten Loop-Runde noch an Callbacks
+    await asyncio.sleep(0)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    bot_module.sp.latency = previous_latency
+    return used / max(1, len(queue))
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(settings):
+    with tempfile.TemporaryDirectory() as data_dir:
+        bot_module = load_bot(settings, data_dir)
+        search_first_audio = await measure_search_play(bot_module, 1)
+        player, enqueue, first_audio, queued, gaps = await measure_playlist(bot_module, 2, settings)
+        render = measure_queue_render(bot_module, player, settings.render_repeats)
+        youtube_first_audio, youtube_queued = await measure_youtube_playlist(bot_module, 3)
+        entry_bytes = await measure_entry_memory(bot_module)
+        player.clear()
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'settings': {
+            'tracks': settings.tracks,
+            'youtube_playlist_size': settings.youtube_playlist_size,
+            'spotify_latency_s': settings.spotify_latency,
+            'search_latency_s': settings.search_latency,
+            'stream_latency_s': settings.stream_latency,
+            'song_seconds': settings.song_seconds,
+            'track_changes': settings.track_changes
+        },
+        'results': {
+            'search_time_to_first_audio_ms': round(search_first_audio * 1000, 3),
+            'playlist_enqueue_ms': round(enqueue * 1000, 3),
+            'playlist_time_to_first_audio_ms': round(first_audio * 1000, 3),
+            'playlist_queued_entries': queued,
+            'youtube_playlist_time_to_first_audio_ms': round(youtube_first_audio * 1000, 3),
+            'youtube_playlist_materialized_entries': youtube_queued,
+            'track_change_gap': summarize(gaps) if gaps else None,
+            'queue_render': summarize(render),
+            'bytes_per_queued_entry': round(entry_bytes, 1),
+            'spotify_calls': bot_module.sp.calls,
+            'ytdlp_calls': StubYoutubeDL.calls
+        }
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline-Benchmark für T_MusicBot")
+    parser.add_argument("--tracks", type=int, default=500, help="Länge der Spotify-Playlist")
+    parser.add_argument("--youtube-playlist-size", type=int, default=5000, help="Länge der YouTube-Playlist")
+    parser.add_argument("--spotify-latency", type=float, default=0.15, help="Sekunden pro Spotify-API-Aufruf")
+    parser.add_argument("--search-latency", type=float, default=0.6, help="Sekunden pro YouTube-Suche")
+    parser.add_argument("--stream-latency", type=float, default=0.8, help="Sekunden pro Stream-Abfrage")
+    parser.add_argument("--song-seconds", type=float, default=2.0,
+                        help="Simulierte Spielzeit pro Song vor dem Songwechsel")
+    parser.add_argument("--track-changes", type=int, default=5, help="Anzahl gemessener Songwechsel")
+    parser.add_argument("--render-repeats", type=int, default=300, help="Wiederholungen der Queue-Anzeige")
+    parser.add_argument("--output", help="JSON-Ergebnis in diese Datei schreiben (Standard: stdout)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    settings = parse_args()
+    # DEBUG-Ausgaben des Bots (auch aus Worker-Threads) nicht mit dem JSON-Ergebnis mischen
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(run(settings))
+    output = json.dumps(result, indent=2)
+    if settings.output:
+        with open(settings.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,71 @@
+"""
+yt-dlp-Aufträge für den Extraktions-Pool von T_MusicBot.py.
+
+Dieses Modul hat beim Import keine Seiteneffekte (keine Konfiguration, keine Datenbanken, kein
+Bot-Objekt): im Pool-Modus "process" lädt jeder Worker-Prozess nur diese Datei, nicht den Bot.
+"""
+import threading
+
+# Options-Profile für yt-dlp. Pro Profil und Worker-Thread wird genau eine YoutubeDL-Instanz
+# angelegt und wiederverwendet, damit Setup sowie Player-/JS-Downloads nur einmal anfallen.
+YDL_PROFILES = {
+    'search': {
+        'extract_flat': 'in_playlist',
+        'quiet': True,
+        'no_warnings': True,
+        # Netzwerk- und Extraktorfehler müssen als Ausnahme ankommen: mit ignoreerrors liefert
+        # yt-dlp stattdessen eine leere Trefferliste, die als "kein Treffer" gecacht würde
+        'ignoreerrors': False,
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+        }
+    },
+    'flat': {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+        'skip_download': True
+    },
+    'stream': {
+        'format': 'bestaudio/best',
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True
+    },
+}
+# Felder eines Suchtreffers, die score_search_result und get_youtube_url_sync verwenden
+SEARCH_ENTRY_KEYS = ('id', 'title', 'duration', 'channel', 'uploader')
+# Felder der Stream-Infos, die Wiedergabe, Embeds und der Stream-URL-Cache verwenden
+STREAM_INFO_KEYS = ('id', 'url', 'title', 'duration', 'thumbnail', 'acodec')
+_ydl_local = threading.local()
+
+
+def load_yt_dlp():
+    import yt_dlp
+    return yt_dlp
+
+
+def get_ydl(profile):
+    """Liefert die YoutubeDL-Instanz des aktuellen Threads für das angegebene Profil."""
+    instances = getattr(_ydl_local, 'instances', None)
+    if instances is None:
+        instances = _ydl_local.instances = {}
+    ydl = instances.get(profile)
+    if ydl is None:
+        ydl = instances[profile] = load_yt_dlp().YoutubeDL(YDL_PROFILES[profile])
+    return ydl
+
+
+def extract_info_job(profile, url):
+    """yt-dlp-Abfrage, gekürzt auf die Felder, die der Bot verwendet (klein genug für die Prozessgrenze)."""
+    try:
+        info = get_ydl(profile).extract_info(url, download=False)
+    except Exception as e:
+        # yt-dlp-Fehler hängen ihren Logger an und lassen sich nicht picklen; aus einem
+        # Worker-Prozess käme sonst nur "Can't pickle ..." statt der eigentlichen Ursache an
+        raise RuntimeError(str(e)) from None
+    if info is None:
+        return None
+    if profile == 'stream':
+        return {key: info.get(key) for key in STREAM_INFO_KEYS}
+    return {'entries': [{key: entry.get(key) for key in SEARCH_ENTRY_KEYS} for entry in info.get('entries') or [] if entry]}